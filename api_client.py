@@ -0,0 +1,220 @@
+import json
+import os
+import struct
+import threading
+import uuid
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from stage_metrics import StageMetrics
+
+# Configuration
+WHISPER_API_URL = "http://localhost:8080/inference"
+OLLAMA_API_URL = "http://localhost:11434/api/generate"
+OLLAMA_MODEL = "llama3.2"
+SD_TXT2IMG_URL = "http://localhost:7860/sdapi/v1/txt2img"
+SD_IMG2IMG_URL = "http://localhost:7860/sdapi/v1/img2img"
+WHISPER_FIELDS = {"temperature": "0.0", "temperature_inc": "0.2", "response_format": "json"}
+
+# (connect, read) timeouts in seconds per service
+TIMEOUTS = {
+    "whisper": (3.05, 60),
+    "ollama": (3.05, 120),
+    "sd": (3.05, 300),
+}
+POOL_SIZE = 8  # keep-alive connections per host
+RETRIES = 3  # failed connects and 502/503/504 are retried with exponential backoff; read timeouts are not
+RETRY_BACKOFF = 0.5  # seconds, doubled on each retry
+
+# Request latency per service, plus error counters
+metrics = StageMetrics()
+
+_sessions = {}
+_session_lock = threading.Lock()
+
+
+def get_session(retry=True):
+    """
+    The shared session, created on first use, with pooled keep-alive connections.
+    With `retry`, failed connects and 502/503/504 replies are retried. A request that
+    was sent and then timed out is not retried: the server may still be working on it.
+    """
+    with _session_lock:
+        if retry not in _sessions:
+            max_retries = Retry(
+                total=RETRIES,
+                read=0,
+                backoff_factor=RETRY_BACKOFF,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=None,  # POST too: a refused or 503'd request never started
+                raise_on_status=False,
+            ) if retry else 0
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=max_retries)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[retry] = session
+        return _sessions[retry]
+
+
+def post(service, url, retry=True, **kwargs):
+    """
+    POST through a shared session using the service's timeout, and record how long it
+    took. Pass `retry=False` for one-shot bodies (generators) that cannot be resent,
+    or when the caller must not be held up by retries.
+    """
+    kwargs.setdefault("timeout", TIMEOUTS[service])
+    try:
+        with metrics.time(service):
+            response = get_session(retry).post(url, **kwargs)
+    except requests.RequestException:
+        metrics.count(f"{service}_errors")
+        raise
+    if response.status_code != 200:
+        metrics.count(f"{service}_errors")
+    return response
+
+
+def transcribe_audio(audio, url=WHISPER_API_URL):
+    """Sends audio (a file path or file-like object) to Whisper for transcription."""
+    if isinstance(audio, str):
+        with open(audio, "rb") as f:
+            return transcribe_audio(f, url)
+    filename = os.path.basename(getattr(audio, "name", "audio.wav"))
+    response = post(
+        "whisper",
+        url,
+        files={"file": (filename, audio)},
+        data=WHISPER_FIELDS,
+    )
+    return _transcription(response)
+
+
+def transcribe_audio_stream(pcm_blocks, data_size, rate, channels=1, sample_width=2, url=WHISPER_API_URL):
+    """
+    Sends audio to Whisper while it is still being recorded.
+
+    `pcm_blocks` yields raw PCM bytes adding up to exactly `data_size`. The WAV header
+    is written up front from that size, and the multipart body is sent with a known
+    Content-Length, so upload overlaps recording and the server sees an ordinary file.
+    """
+    boundary = uuid.uuid4().hex
+    head = b"".join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in WHISPER_FIELDS.items()
+    )
+    head += (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="audio.wav"\r\n'
+        f"Content-Type: audio/wav\r\n\r\n"
+    ).encode()
+    head += wav_header(data_size, rate, channels, sample_width)
+    tail = f"\r\n--{boundary}--\r\n".encode()
+
+    def body():
+        yield head
+        sent = 0
+        for block in pcm_blocks:
+            sent += len(block)
+            yield block
+        if sent != data_size:
+            raise ValueError(f"Expected {data_size} bytes of audio, got {sent}")
+        yield tail
+
+    response = post(
+        "whisper",
+        url,
+        retry=False,  # the body is a one-shot generator
+        data=_SizedBody(body(), len(head) + data_size + len(tail)),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+    )
+    return _transcription(response)
+
+
+def _transcription(response):
+    if response.status_code == 200:
+        return response.json().get("text", "").strip()
+    else:
+        raise Exception(f"Whisper API error: {response.text}")
+
+
+def wav_header(data_size, rate, channels=1, sample_width=2):
+    """The 44-byte header of a PCM WAV file holding `data_size` bytes of samples."""
+    byte_rate = rate * channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, rate, byte_rate, channels * sample_width, 8 * sample_width,
+        b"data", data_size,
+    )
+
+
+class _SizedBody:
+    """An iterable request body with a known length, so requests sends Content-Length instead of chunking."""
+
+    def __init__(self, chunks, length):
+        self.chunks = chunks
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+
+def reprocess_text_with_ollama(text, guiding_prompt, model=OLLAMA_MODEL, url=OLLAMA_API_URL):
+    """Sends text to Ollama for reprocessing."""
+    payload = {
+        "model": model,
+        "prompt": f"{guiding_prompt}\n\n{text}",
+        "stream": False
+    }
+    response = post("ollama", url, json=payload)
+    if response.status_code == 200:
+        return response.json().get("response", "").strip()
+    else:
+        raise Exception(f"Ollama API error: {response.text}")
+
+
+def stream_text_with_ollama(text, guiding_prompt, model=OLLAMA_MODEL, url=OLLAMA_API_URL):
+    """Like reprocess_text_with_ollama, but yields the response in pieces as Ollama writes it."""
+    payload = {
+        "model": model,
+        "prompt": f"{guiding_prompt}\n\n{text}",
+        "stream": True
+    }
+    response = post("ollama", url, json=payload, stream=True)
+    if response.status_code != 200:
+        raise Exception(f"Ollama API error: {response.text}")
+    with response:
+        # One JSON object per line, each carrying the next piece of "response"
+        for line in response.iter_lines():
+            if not line:
+                continue
+            try:
+                piece = json.loads(line.decode("utf-8"))
+            except json.JSONDecodeError as e:
+                print("JSON Decode Error:", e)
+                continue
+            if piece.get("response"):
+                yield piece["response"]
+            if piece.get("done"):
+                break
+
+
+def txt2img(payload, url=SD_TXT2IMG_URL, **kwargs):
+    """Sends a txt2img request to the A1111 API and returns its list of base64 images."""
+    response = post("sd", url, json=payload, **kwargs)
+    if response.status_code == 200:
+        return response.json().get("images", [])
+    else:
+        raise Exception(f"Stable Diffusion API error: {response.text}")
+
+
+def img2img(payload, url=SD_IMG2IMG_URL, **kwargs):
+    """Sends an img2img request to the A1111 API and returns its list of base64 images."""
+    response = post("sd", url, json=payload, **kwargs)
+    if response.status_code == 200:
+        return response.json().get("images", [])
+    else:
+        raise Exception(f"Stable Diffusion API error: {response.text}")
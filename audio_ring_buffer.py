@@ -0,0 +1,80 @@
+import threading
+import numpy as np
+
+
+class AudioRingBuffer:
+    """
+    A preallocated float32 sample ring for passing audio from a realtime callback to a
+    consumer thread without allocating on the audio thread.
+
+    One writer (the audio callback) and one reader. `write()` copies samples into the
+    ring in place and never blocks on the reader; `read()` copies unread samples out
+    into a caller-provided array. If the reader falls more than `capacity` samples
+    behind, the oldest audio is lost and counted in `overruns`.
+
+    Example Usage:
+    --------------
+    ```python
+    ring = AudioRingBuffer(capacity=16000 * 30)
+
+    def audio_callback(indata, frames, time, status):
+        ring.write(indata[:, 0])
+
+    window = np.empty(16000 * 2, dtype=np.float32)
+    if ring.wait_for(len(window), timeout=1.0):
+        ring.read(window)
+    ```
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=np.float32)
+        self.write_pos = 0  # Total samples ever written
+        self.read_pos = 0  # Total samples ever read
+        self.overruns = 0  # Samples lost because the reader fell behind
+        self.data_ready = threading.Event()
+
+    def write(self, samples):
+        """Copy samples into the ring. Safe to call from the audio callback."""
+        n = len(samples)
+        if n > self.capacity:
+            # Only the newest `capacity` samples fit; skip the rest as if overwritten
+            self.write_pos += n - self.capacity
+            samples = samples[n - self.capacity:]
+            n = self.capacity
+        start = self.write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        if first < n:
+            self.buffer[:n - first] = samples[first:]
+        self.write_pos += n
+        self.data_ready.set()
+
+    def available(self):
+        """Number of unread samples."""
+        return min(self.write_pos - self.read_pos, self.capacity)
+
+    def wait_for(self, count, timeout=None):
+        """Block until at least `count` samples are unread. Returns False on timeout."""
+        while self.available() < count:
+            self.data_ready.clear()
+            if self.available() >= count:
+                break
+            if not self.data_ready.wait(timeout):
+                return False
+        return True
+
+    def read(self, out):
+        """Copy up to `len(out)` unread samples into `out`. Returns the number copied."""
+        behind = self.write_pos - self.read_pos
+        if behind > self.capacity:
+            self.overruns += behind - self.capacity
+            self.read_pos = self.write_pos - self.capacity
+        n = min(len(out), self.write_pos - self.read_pos)
+        start = self.read_pos % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        if first < n:
+            out[first:n] = self.buffer[:n - first]
+        self.read_pos += n
+        return n
@@ -0,0 +1,110 @@
+import numpy as np
+import torch
+
+BGR_TO_RGB = (2, 1, 0)
+
+
+class FrameConverter:
+    """
+    Moves frames between uint8 HWC ndarrays (what cv2 captures and Spout sends) and
+    normalised NCHW model tensors, through staging buffers allocated once.
+
+    Going in, a frame is copied once into a pinned host buffer, uploaded as uint8 (a
+    quarter of the bytes of float32), then reordered, converted and scaled to [0, 1]
+    on the device into a reused input tensor. Coming out, the model output is
+    denormalised if need be, clamped, scaled and reordered to uint8 HWC on the device, and copied once into a pinned
+    host buffer whose ndarray view is handed straight to the sink. No PIL images are
+    made and nothing is allocated per frame.
+
+    Example Usage:
+    --------------
+    ```python
+    converter = FrameConverter(512, 512, device="cuda", dtype=torch.float16)
+
+    ret, frame = cap.read()
+    input_batch = converter.to_tensor(frame)    # (1, 3, 512, 512) on the device
+    output = stream.stream(input_batch)         # raw VAE output, in [-1, 1]
+    image = converter.to_numpy(output, denormalize=True)  # (512, 512, 3) uint8 RGB ndarray
+    sender.send_image(image, False)
+    ```
+
+    Tensors returned by `to_tensor()` and arrays returned by `to_numpy()` are reused
+    after `slots` more calls, so the model or sink must be done with one by then; give
+    pipelined loops enough slots to cover the frames in flight. To skip even the first host copy, have
+    the producer write straight into `input_buffer(n)` and call `upload(n)`.
+    """
+
+    def __init__(self, height, width, device="cuda", dtype=torch.float16, batch=1, slots=1, channels=3):
+        self.device = torch.device(device)
+        self.dtype = dtype
+        self.pinned = self.device.type == "cuda" and torch.cuda.is_available()
+        shape_hwc = (batch, height, width, channels)
+        self.host_in = torch.empty(shape_hwc, dtype=torch.uint8, pin_memory=self.pinned)
+        if self.device.type == "cpu":
+            self.device_in = self.host_in  # nothing to upload
+        else:
+            self.device_in = torch.empty(shape_hwc, dtype=torch.uint8, device=self.device)
+        self.inputs = [
+            torch.empty((batch, channels, height, width), dtype=dtype, device=self.device) for _ in range(slots)
+        ]
+        self.in_slot = 0
+        self.scaled = torch.empty((batch, channels, height, width), dtype=dtype, device=self.device)
+        self.device_out = torch.empty(shape_hwc, dtype=torch.uint8, device=self.device)
+        self.host_out = [torch.empty(shape_hwc, dtype=torch.uint8, pin_memory=self.pinned) for _ in range(slots)]
+        self.out_slot = 0
+        # Set once the last upload has finished reading host_in, so it can be rewritten
+        self.upload_done = torch.cuda.Event() if self.pinned else None
+
+    def input_buffer(self, count=1):
+        """The host staging array for the next `count` frames, (count, H, W, C) uint8."""
+        if self.upload_done is not None:
+            self.upload_done.synchronize()
+        return self.host_in[:count].numpy()
+
+    def upload(self, count=1, bgr=True):
+        """Convert the frames in `input_buffer(count)` to a (count, C, H, W) tensor in [0, 1]."""
+        if self.device_in is not self.host_in:
+            self.device_in[:count].copy_(self.host_in[:count], non_blocking=self.pinned)
+        if self.upload_done is not None:
+            self.upload_done.record()
+        source = self.device_in[:count].permute(0, 3, 1, 2)
+        target = self.inputs[self.in_slot][:count]
+        self.in_slot = (self.in_slot + 1) % len(self.inputs)
+        if bgr:
+            for channel, source_channel in enumerate(BGR_TO_RGB):
+                target[:, channel].copy_(source[:, source_channel])
+        else:
+            target.copy_(source)
+        return target.div_(255)
+
+    def to_tensor(self, frames, bgr=True):
+        """Convert a (H, W, C) frame or (N, H, W, C) frames, uint8 BGR by default, to a model input."""
+        frames = frames[None] if frames.ndim == 3 else frames
+        np.copyto(self.input_buffer(len(frames)), frames)
+        return self.upload(len(frames), bgr)
+
+    def to_numpy(self, output, bgr=False, denormalize=False):
+        """
+        Convert a (C, H, W) or (N, C, H, W) output in [0, 1], or in [-1, 1] with
+        `denormalize` (what `StreamDiffusion` returns), to uint8 HWC. Returns one
+        (H, W, C) array for a single image, else (N, H, W, C). RGB unless `bgr`.
+        """
+        single = output.ndim == 3
+        output = output[None] if single else output
+        count = len(output)
+        scaled = self.scaled[:count]
+        if denormalize:
+            torch.mul(output, 0.5, out=scaled).add_(0.5).clamp_(0, 1)
+        else:
+            torch.clamp(output, 0, 1, out=scaled)
+        scaled.mul_(255).add_(0.5)  # round when truncating to uint8
+        if bgr:
+            for channel, source_channel in enumerate(BGR_TO_RGB):
+                self.device_out[:count, ..., channel].copy_(scaled[:, source_channel])
+        else:
+            self.device_out[:count].copy_(scaled.permute(0, 2, 3, 1))
+        host_out = self.host_out[self.out_slot]
+        self.out_slot = (self.out_slot + 1) % len(self.host_out)
+        host_out[:count].copy_(self.device_out[:count])
+        array = host_out[:count].numpy()
+        return array[0] if single else array
@@ -0,0 +1,158 @@
+import threading
+import time
+import cv2
+import numpy as np
+
+BLEND = "blend"
+FLOW = "flow"
+
+
+class FrameInterpolator:
+    """
+    Holds a steady display rate when the model runs slower, by synthesising frames
+    between consecutive model outputs on the CPU in its own worker thread.
+
+    The model loop `push()`es each output (an HWC ndarray, uint8 or float in any range;
+    float16 is widened to float32, which OpenCV needs). The worker
+    ticks at `display_fps` and on every tick emits a frame part way between the last
+    two outputs, according to how much of the measured model interval has passed. So
+    the display runs one model frame behind, and motion between outputs is spread
+    over the ticks instead of jumping once per output.
+
+    - `"blend"`: a cross-fade between the two outputs. Cheap.
+    - `"flow"`: dense optical flow (Farneback, computed at `flow_scale` of the frame
+      size, once per pair of outputs) warps both outputs towards the in-between
+      time before they are blended, so moving edges slide instead of ghosting.
+
+    Example Usage:
+    --------------
+    ```python
+    interpolator = FrameInterpolator(lambda frame: put_latest(display_queue, frame), display_fps=30)
+    interpolator.start()
+
+    while True:
+        interpolator.push(postprocess(stream.stream(input_batch)))
+    ```
+
+    `emit(frame)` is called on the worker thread with an array from a pool of `slots`
+    reused buffers, so whatever consumes it must be done with it within `slots` more
+    frames. Pushed frames are copied, so the producer may reuse its own buffer.
+    """
+
+    def __init__(self, emit, display_fps=30, mode=BLEND, flow_scale=0.5, slots=3):
+        if mode not in (BLEND, FLOW):
+            raise ValueError(f"Unknown interpolation mode: {mode}")
+        self.emit = emit
+        self.tick = 1 / display_fps
+        self.mode = mode
+        self.flow_scale = flow_scale
+        self.slots = slots
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.previous = None  # the two most recent outputs
+        self.current = None
+        self.current_time = None
+        self.interval = None  # smoothed time between outputs
+        self.pair = 0  # bumped on every push, so the worker knows when to recompute flow
+        self.grid = None  # pixel coordinates for remapping, (grid_x, grid_y)
+        self.outputs = None
+        self.out_slot = 0
+        # Stats
+        self.keyframes = 0
+        self.interpolated = 0
+
+    def push(self, frame):
+        """Add a model output. Cheap enough to call from the model loop."""
+        now = time.perf_counter()
+        # A new array per output, so the worker can read the last pair unlocked
+        frame = frame.astype(np.float32) if frame.dtype == np.float16 else frame.copy()
+        with self.lock:
+            if self.current is not None:
+                elapsed = now - self.current_time
+                self.interval = elapsed if self.interval is None else 0.8 * self.interval + 0.2 * elapsed
+            self.previous, self.current = self.current, frame
+            self.current_time = now
+            self.pair += 1
+            self.keyframes += 1
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _run(self):
+        flow_pair = None
+        flow = None
+        emitted_pair = None
+        next_tick = time.perf_counter()
+        while not self.stop_event.is_set():
+            next_tick += self.tick
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter()  # fell behind; don't try to catch up
+
+            with self.lock:
+                previous, current, pair = self.previous, self.current, self.pair
+                current_time, interval = self.current_time, self.interval
+            if current is None:
+                continue
+            t = 1.0 if interval is None else min(1.0, (time.perf_counter() - current_time) / interval)
+            if t >= 1.0 and emitted_pair == pair:
+                continue  # nothing new to show until the next output arrives
+
+            if self.outputs is None:
+                self.outputs = [np.empty_like(current) for _ in range(self.slots)]
+            out = self.outputs[self.out_slot]
+            if t >= 1.0:
+                np.copyto(out, current)
+            elif self.mode == FLOW:
+                if flow_pair != pair:
+                    flow = self._flow(previous, current)
+                    flow_pair = pair
+                self._warped_blend(previous, current, flow, t, out)
+            else:
+                cv2.addWeighted(previous, 1 - t, current, t, 0, dst=out)
+
+            self.out_slot = (self.out_slot + 1) % self.slots
+            if t < 1.0:
+                self.interpolated += 1
+            emitted_pair = pair
+            self.emit(out)
+
+    def _flow(self, previous, current):
+        """Dense flow from `previous` to `current`, (H, W, 2) in full-size pixels."""
+        height, width = previous.shape[:2]
+        small = (max(1, int(width * self.flow_scale)), max(1, int(height * self.flow_scale)))
+        grays = [
+            cv2.cvtColor(cv2.resize(frame, small, interpolation=cv2.INTER_AREA), cv2.COLOR_RGB2GRAY)
+            for frame in (previous, current)
+        ]
+        if grays[0].dtype != np.uint8:
+            # Float output may be [0, 1] or the model's [-1, 1]; map the pair's joint range to uint8
+            low = min(gray.min() for gray in grays)
+            high = max(gray.max() for gray in grays)
+            scale = 255 / (high - low) if high > low else 0
+            grays = [((gray - low) * scale).astype(np.uint8) for gray in grays]
+        flow = cv2.calcOpticalFlowFarneback(grays[0], grays[1], None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        return cv2.resize(flow, (width, height)) / self.flow_scale
+
+    def _warped_blend(self, previous, current, flow, t, out):
+        # Sample `previous` back along the flow and `current` forward along it, so both
+        # land on where each pixel is at time t, then cross-fade them
+        height, width = previous.shape[:2]
+        if self.grid is None or self.grid[0].shape != (height, width):
+            self.grid = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+        grid_x, grid_y = self.grid
+        from_previous = cv2.remap(previous, grid_x - t * flow[..., 0], grid_y - t * flow[..., 1],
+                                  cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        from_current = cv2.remap(current, grid_x + (1 - t) * flow[..., 0], grid_y + (1 - t) * flow[..., 1],
+                                 cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        cv2.addWeighted(from_previous, 1 - t, from_current, t, 0, dst=out)
@@ -0,0 +1,70 @@
+import threading
+import numpy as np
+
+
+class FrameRingBuffer:
+    """
+    A fixed-capacity, thread-safe ring buffer of raw uint8 camera frames.
+
+    Storage is allocated once up front as a single `(capacity, height, width, channels)`
+    array, so the capture thread never allocates per frame. Frames are stored exactly
+    as they come off the camera (BGR for OpenCV); conversion to tensors is left to the
+    consumer so only the frames it actually samples are ever converted.
+
+    Frames written since the last `take_latest()` are "unread". When the writer laps
+    the reader, the oldest unread frame is overwritten and counted in `dropped`.
+
+    Example Usage:
+    --------------
+    ```python
+    buffer = FrameRingBuffer(capacity=8, height=512, width=512)
+
+    # capture thread
+    buffer.write(frame)
+
+    # inference thread
+    frames = buffer.take_latest(2)  # (2, 512, 512, 3) uint8, newest first, or None
+    ```
+    """
+
+    def __init__(self, capacity, height, width, channels=3):
+        self.capacity = capacity
+        self.frames = np.zeros((capacity, height, width, channels), dtype=np.uint8)
+        self.lock = threading.Lock()
+        self.write_index = 0  # Next slot to be written
+        self.unread = 0  # Frames written since the last take_latest()
+        self.written = 0  # Total frames written
+        self.dropped = 0  # Unread frames that were overwritten
+
+    def write(self, frame):
+        """Copy a frame into the next slot, overwriting the oldest one if the buffer is full."""
+        with self.lock:
+            np.copyto(self.frames[self.write_index], frame)
+            self.write_index = (self.write_index + 1) % self.capacity
+            self.written += 1
+            if self.unread == self.capacity:
+                self.dropped += 1
+            else:
+                self.unread += 1
+
+    def available(self):
+        """Number of unread frames currently held."""
+        with self.lock:
+            return self.unread
+
+    def take_latest(self, count, out=None):
+        """
+        Copy out `count` evenly spaced unread frames, newest first, and mark all
+        unread frames as consumed. Returns None if fewer than `count` are unread.
+        """
+        if out is None:
+            out = np.empty((count,) + self.frames.shape[1:], dtype=np.uint8)
+        with self.lock:
+            if self.unread < count:
+                return None
+            step = self.unread // count
+            for i in range(count):
+                index = (self.write_index - 1 - step * i) % self.capacity
+                np.copyto(out[i], self.frames[index])
+            self.unread = 0
+        return out
@@ -0,0 +1,139 @@
+import queue
+from multiprocessing import shared_memory
+import numpy as np
+
+DROP_OLDEST = "drop-oldest"
+LATEST_ONLY = "latest-only"
+
+# Header fields, stored as int64 at the start of the shared block
+_WRITE_SEQ, _READ_SEQ, _DROPPED, _PUT_COUNT = range(4)
+_HEADER_SIZE = 4 * 8
+
+
+class SharedFrameTransport:
+    """
+    A fixed pool of frame slots in `multiprocessing.shared_memory`, used in place of
+    an unbounded `multiprocessing.Queue` to move frames between processes.
+
+    Frames are copied into a preallocated slot instead of being pickled, and slots
+    are reused in a ring, so memory use is fixed no matter how far the consumer falls
+    behind. When every slot is full the drop policy decides what is lost:
+
+    - `"drop-oldest"`: the oldest pending frame is overwritten.
+    - `"latest-only"`: every pending frame is discarded so the consumer always gets
+      the newest one.
+
+    It supports the subset of the `Queue` interface the viewer uses (`put`, `get`,
+    `empty`, `qsize`), so it can be passed anywhere a frame queue was used.
+
+    Example Usage:
+    --------------
+    ```python
+    ctx = get_context("spawn")
+    transport = SharedFrameTransport(ctx, shape=(1, 3, 512, 512), slots=4)
+    # pass `transport` to the producer and consumer processes as an argument
+    transport.put(output_image)     # producer
+    frame = transport.get()         # consumer, raises queue.Empty if nothing pending
+    transport.unlink()              # owner, once both processes are done
+    ```
+
+    Shape and dtype are fixed when the transport is created; frames with the same
+    number of elements are reshaped into the slot shape.
+    """
+
+    def __init__(self, ctx, shape, dtype=np.float32, slots=4, policy=DROP_OLDEST, as_tensor=True):
+        if policy not in (DROP_OLDEST, LATEST_ONLY):
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        self.policy = policy
+        self.as_tensor = as_tensor
+        self.lock = ctx.Lock()
+        frame_size = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=_HEADER_SIZE + frame_size * slots)
+        self.owner = True
+        self._attach()
+        self.header[:] = 0
+
+    def _attach(self):
+        self.header = np.ndarray((4,), dtype=np.int64, buffer=self.shm.buf)
+        self.frames = np.ndarray(
+            (self.slots,) + self.shape, dtype=self.dtype, buffer=self.shm.buf, offset=_HEADER_SIZE
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ("shm", "header", "frames"):
+            del state[key]
+        state["name"] = self.shm.name
+        return state
+
+    def __setstate__(self, state):
+        name = state.pop("name")
+        self.__dict__.update(state)
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.owner = False
+        self._attach()
+
+    def put(self, frame, block=False):
+        """Copy a frame (ndarray or CPU tensor) into the next slot, dropping per the policy if full."""
+        if hasattr(frame, "numpy"):
+            frame = frame.numpy()
+        frame = np.asarray(frame).reshape(self.shape)
+        with self.lock:
+            header = self.header
+            depth = header[_WRITE_SEQ] - header[_READ_SEQ]
+            if self.policy == LATEST_ONLY and depth > 0:
+                header[_DROPPED] += depth
+                header[_READ_SEQ] = header[_WRITE_SEQ]
+            elif depth == self.slots:
+                header[_DROPPED] += 1
+                header[_READ_SEQ] += 1
+            np.copyto(self.frames[header[_WRITE_SEQ] % self.slots], frame, casting="unsafe")
+            header[_WRITE_SEQ] += 1
+            header[_PUT_COUNT] += 1
+
+    def get(self, block=False, out=None):
+        """Copy out the oldest pending frame. Raises `queue.Empty` if there is none."""
+        if out is None:
+            out = np.empty(self.shape, dtype=self.dtype)
+        with self.lock:
+            header = self.header
+            if header[_WRITE_SEQ] == header[_READ_SEQ]:
+                raise queue.Empty
+            np.copyto(out, self.frames[header[_READ_SEQ] % self.slots])
+            header[_READ_SEQ] += 1
+        if self.as_tensor:
+            import torch
+            return torch.from_numpy(out)
+        return out
+
+    def qsize(self):
+        """Number of frames waiting to be read."""
+        with self.lock:
+            return int(self.header[_WRITE_SEQ] - self.header[_READ_SEQ])
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def stats(self):
+        """Counters for monitoring: frames put, frames dropped and current queue depth."""
+        with self.lock:
+            header = self.header
+            return {
+                "put": int(header[_PUT_COUNT]),
+                "dropped": int(header[_DROPPED]),
+                "depth": int(header[_WRITE_SEQ] - header[_READ_SEQ]),
+            }
+
+    def close(self):
+        """Detach this process from the shared block."""
+        del self.header, self.frames
+        self.shm.close()
+
+    def unlink(self):
+        """Detach and free the shared block. Call once, from the process that created it."""
+        self.close()
+        if self.owner:
+            self.shm.unlink()
@@ -16,12 +16,26 @@ midi_mappings = {}
 # JSON file for saving/loading mappings
 MAPPING_FILE = "midi_mappings.json"
 
+# Integer codes for the message types that can be mapped
+MESSAGE_TYPE_CODES = {"note_on": 0, "note_off": 1, "control_change": 2}
+
+# midi_mappings compiled to (type code, channel, note/control) -> variable name.
+# Replaced whole, never modified, so the MIDI callback can read it without a lock.
+dispatch_table = {}
+
+# Handler that mapped messages are applied to directly, or None outside perform mode
+dispatch_handler = None
+
+# Open MIDI input port, kept so its callback stays registered
+midi_port = None
+
 # Load existing mappings if available
 def load_mappings():
     global midi_mappings
     if os.path.exists(MAPPING_FILE):
         with open(MAPPING_FILE, "r") as file:
             midi_mappings = json.load(file)
+        compile_mappings()
         print(f"Loaded {len(midi_mappings)} mappings from {MAPPING_FILE}")
     else:
         print("No existing mappings found.")
@@ -32,13 +46,35 @@ def save_mappings():
         json.dump(midi_mappings, file, indent=4)
     print(f"Saved mappings to {MAPPING_FILE}")
 
-# MIDI listener function
-def midi_listener(port_name):
-    """Runs in a separate thread, listening for MIDI messages."""
-    with mido.open_input(port_name) as inport:
-        print(f"Listening for MIDI messages on {port_name}...")
-        for msg in inport:
-            midi_queue.put(msg)  # Put the received MIDI message in the queue
+# Build the integer-keyed dispatch table from the "type_number" string mappings
+def compile_mappings():
+    global dispatch_table
+    table = {}
+    for msg_key, function_name in midi_mappings.items():
+        msg_type, number = msg_key.rsplit("_", 1)
+        if msg_type in MESSAGE_TYPE_CODES:
+            for channel in range(16):  # mappings are learned without a channel
+                table[(MESSAGE_TYPE_CODES[msg_type], channel, int(number))] = function_name
+    dispatch_table = table
+
+# MIDI callback, runs on the MIDI backend's thread for every message
+def on_midi_message(msg):
+    """Apply mapped messages straight to the handler in perform mode; queue everything else."""
+    handler = dispatch_handler
+    if handler is not None:
+        type_code = MESSAGE_TYPE_CODES.get(msg.type)
+        if type_code == 2:
+            function_name = dispatch_table.get((type_code, msg.channel, msg.control))
+            value = msg.value
+        elif type_code is not None:
+            function_name = dispatch_table.get((type_code, msg.channel, msg.note))
+            value = msg.velocity
+        else:
+            function_name = None
+        if function_name is not None:
+            handler.set_variable(function_name, value)
+            return
+    midi_queue.put(msg)  # Put the received MIDI message in the queue
 
 def flush_midi_queue():
     """Remove all queued MIDI messages to prevent stale input."""
@@ -48,10 +84,11 @@ def flush_midi_queue():
         except queue.Empty:
             break  # Exit if queue is already empty
 
-# Start MIDI listening thread
-def start_midi_thread(midi_port):
-    thread = threading.Thread(target=midi_listener, args=(midi_port,), daemon=True)
-    thread.start()
+# Open the MIDI input; messages are delivered to on_midi_message
+def open_midi_input(port_name):
+    global midi_port
+    midi_port = mido.open_input(port_name, callback=on_midi_message)
+    print(f"Listening for MIDI messages on {port_name}...")
 
 # Enter Learn Mode
 def learn_mode():
@@ -71,6 +108,7 @@ def learn_mode():
             function_name = input(f"Enter function name for {msg_key}: ").strip()
             if function_name:
                 midi_mappings[msg_key] = function_name
+                compile_mappings()
                 print(f"Assigned {msg_key} -> {function_name}")
             else:
                 print("No function assigned, ignoring this mapping.")
@@ -93,20 +131,25 @@ def perform_mode(handler):
     exit_thread = threading.Thread(target=listen_for_exit, daemon=True)
     exit_thread.start()
     
-    while not stop_flag.is_set():
-        try:
-            msg = midi_queue.get(timeout=1)  # Check for messages every second
-            msg_key = f"{msg.type}_{msg.note if msg.type in ['note_on', 'note_off'] else msg.control}"
-            
-            if msg_key in midi_mappings:
-                handler.update_variable(midi_mappings[msg_key], msg.value)
-                #print(f"Function: {midi_mappings[msg_key]}, Value: {msg.value}")
-            else:
-                print(f"Unmapped MIDI message: {msg}")
-        except queue.Empty:
-            pass  # No messages, just continue checking
+    dispatch_midi(handler, stop_flag)
     
     print("Exiting Perform Mode...")
+
+# Route mapped MIDI messages to the handler until stop_flag is set. Mapped
+# messages are applied in the MIDI callback; only unmapped ones reach the queue.
+def dispatch_midi(handler, stop_flag):
+    global dispatch_handler
+    flush_midi_queue()
+    dispatch_handler = handler
+    try:
+        while not stop_flag.is_set():
+            try:
+                msg = midi_queue.get(timeout=1)  # Check for messages every second
+                print(f"Unmapped MIDI message: {msg}")
+            except queue.Empty:
+                pass  # No messages, just continue checking
+    finally:
+        dispatch_handler = None
             
 # Main menu
 def main_menu():
@@ -173,8 +216,8 @@ if __name__ == "__main__":
     # Load existing mappings
     load_mappings()
 
-    # Start the MIDI listening thread
-    start_midi_thread(selected_midi_port)
+    # Start listening for MIDI messages
+    open_midi_input(selected_midi_port)
 
     # Start the CLI menu
     main_menu()
@@ -0,0 +1,123 @@
+from collections import OrderedDict
+import torch
+
+
+class PromptEmbeddingCache:
+    """
+    An LRU cache of prompt conditioning for a `StreamDiffusionWrapper`.
+
+    Calling the wrapper with a prompt (`stream(image, prompt)`) re-runs the text
+    encoder on every frame. Instead, `apply(prompt)` encodes a prompt the first time
+    it is seen, keeps the result, and on later calls just points the stream at the
+    stored embedding, so switching back to a recent prompt costs nothing. Frames are
+    then streamed without a prompt: `stream(image)`.
+
+    This does the same as `StreamDiffusion.update_prompt`, which only replaces the
+    conditional embedding, so it suits the "none" and "self" cfg types.
+
+    Example Usage:
+    --------------
+    ```python
+    prompts = PromptEmbeddingCache(stream)
+
+    prompts.apply(current_prompt)  # encodes only if this prompt isn't cached
+    image = stream(frame_data)
+    ```
+    """
+
+    def __init__(self, wrapper, maxsize=32):
+        self.stream = wrapper.stream  # the underlying StreamDiffusion
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.current = None
+        self.hits = 0
+        self.misses = 0
+
+    @torch.no_grad()
+    def encode(self, prompt):
+        """The conditioning for `prompt` repeated to the stream's batch size, from cache if possible."""
+        if prompt in self.cache:
+            self.cache.move_to_end(prompt)
+            self.hits += 1
+            return self.cache[prompt]
+        self.misses += 1
+        encoder_output = self.stream.pipe.encode_prompt(
+            prompt=prompt,
+            device=self.stream.device,
+            num_images_per_prompt=1,
+            do_classifier_free_guidance=False,
+        )
+        prompt_embeds = encoder_output[0].repeat(self.stream.batch_size, 1, 1)
+        self.cache[prompt] = prompt_embeds
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+        return prompt_embeds
+
+    def apply(self, prompt):
+        """Make `prompt` the stream's conditioning. Does nothing if it already is."""
+        if prompt == self.current:
+            return
+        self.stream.prompt_embeds = self.encode(prompt)
+        self.current = prompt
+
+
+class PromptBank:
+    """
+    Blends several prompts live from weights held in registered variables, such as
+    the Launch Control XL faders routed through `VariableHandler` by `midi_learn.py`.
+
+    Each prompt is encoded once (through a `PromptEmbeddingCache`) and the embeddings
+    are stacked on the device. `blend()` reads the current weights, normalises them
+    to sum to one, and mixes the stack with a single matrix multiply into a reused
+    output tensor, which becomes the stream's conditioning. No text-encoder call is
+    made, so it can run every frame and a fader move shows up in the next frame.
+
+    Example Usage:
+    --------------
+    ```python
+    handler = VariableHandler()
+    faders = [[0], [0]]
+    handler.register("fader_0", faders[0])
+    handler.register("fader_1", faders[1])
+
+    bank = PromptBank(prompts, ["a forest", "a city at night"], faders)
+    while True:
+        bank.blend()  # only does work when a weight has changed
+        image = stream(frame_data)
+    ```
+
+    Weights are raw variable values divided by `scale` (127 for MIDI CC). When they
+    are all zero the first prompt is used. The stream's existing conditioning (e.g. a
+    typed prompt) is left alone until a weight changes.
+    """
+
+    def __init__(self, cache, prompts, weights, scale=127):
+        self.cache = cache
+        self.prompts = list(prompts)
+        self.weights = weights  # mutable refs, e.g. [value] lists registered with a VariableHandler
+        self.scale = scale
+        embeddings = torch.stack([cache.encode(prompt) for prompt in self.prompts])
+        self.shape = embeddings.shape[1:]
+        self.flat = embeddings.reshape(len(self.prompts), -1)  # (prompts, batch * tokens * dim)
+        self.out = torch.empty((1, self.flat.shape[1]), device=self.flat.device, dtype=self.flat.dtype)
+        # Start from the current values, so the stream keeps its prompt until one moves
+        self.last_values = [ref[0] for ref in self.weights]
+
+    def blend(self):
+        """Apply the current weighted mix to the stream. Returns True if the conditioning changed."""
+        values = [ref[0] for ref in self.weights]
+        if values == self.last_values:
+            return False
+        self.last_values = values
+        weights = torch.tensor(values, dtype=torch.float32) / self.scale
+        total = float(weights.sum())
+        if total <= 0:
+            weights = torch.zeros(len(self.prompts))
+            weights[0] = 1
+        else:
+            weights /= total
+        weights = weights.to(device=self.flat.device, dtype=self.flat.dtype, non_blocking=True)
+        torch.mm(weights.unsqueeze(0), self.flat, out=self.out)
+        self.cache.stream.prompt_embeds = self.out.view(self.shape)
+        self.cache.current = None  # the conditioning is a mix, not any single prompt
+        return True
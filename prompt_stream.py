@@ -0,0 +1,84 @@
+import json
+
+
+class PromptStreamParser:
+    """
+    Pulls the strings of one JSON array field (by default `"sd-prompt"`) out of LLM
+    output as it streams in, returning each string as soon as its closing quote
+    arrives instead of waiting for the whole document.
+
+    It is deliberately tolerant of what models actually write: anything outside the
+    field is skipped, so code fences, a missing opening or closing brace, text before
+    or after the JSON, or a response cut off part way all still yield every prompt
+    that was completed. A single string value instead of an array is yielded too.
+
+    Example Usage:
+    --------------
+    ```python
+    parser = PromptStreamParser()
+
+    for piece in stream_text_with_ollama(transcription, guiding_prompt):
+        for prompt in parser.feed(piece):
+            generate_sd_image(prompt)  # starts while the LLM is still writing
+    ```
+    """
+
+    def __init__(self, key="sd-prompt"):
+        self.key = key
+        self.in_string = False
+        self.escape = False
+        self.chars = []  # the string being read
+        self.last_string = None  # a string just closed outside the field; a key if ':' follows
+        self.awaiting_value = False  # seen `"<key>":`, the value comes next
+        self.nesting = []  # "[" / "{" containers open inside the field's value
+        self.prompts = []  # every prompt found so far
+
+    def feed(self, text):
+        """Add the next piece of output. Returns the prompts completed by it (often none)."""
+        found = []
+        for ch in text:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    self._end_string(found)
+                    continue
+                self.chars.append(ch)
+                continue
+            if ch == '"':
+                self.in_string = True
+                self.chars = []
+                continue
+            if ch.isspace():
+                continue
+            if ch == ":" and not self.nesting and self.last_string is not None:
+                self.awaiting_value = self.last_string == self.key
+            elif ch == "[" and (self.awaiting_value or self.nesting):
+                self.nesting.append(ch)
+                self.awaiting_value = False
+            elif ch == "{" and self.nesting:
+                self.nesting.append(ch)
+            elif ch in "]}" and self.nesting:
+                self.nesting.pop()  # tolerant: doesn't check the bracket matches
+            else:
+                self.awaiting_value = False
+            self.last_string = None
+        return found
+
+    def _end_string(self, found):
+        raw = "".join(self.chars)
+        try:
+            value = json.loads(f'"{raw}"')
+        except json.JSONDecodeError:
+            value = raw  # e.g. a raw newline inside the string; keep it as written
+        if self.nesting == ["["] or self.awaiting_value:  # only direct elements of the array
+            self.awaiting_value = False
+            value = value.strip()
+            if value:
+                self.prompts.append(value)
+                found.append(value)
+        elif not self.nesting:
+            self.last_string = value
@@ -0,0 +1,107 @@
+from collections import deque
+
+# What a change of each setting costs to apply to a running StreamDiffusion
+REBUILD = "rebuild"  # new model: resolution or number of denoising steps changed
+PREPARE = "prepare"  # same number of steps at different t indices: recompute the schedule
+THRESHOLD = "threshold"  # only the similar-image filter threshold changed
+
+
+def change_kind(old, new):
+    """The cheapest way to go from settings `old` to `new`: REBUILD, PREPARE, THRESHOLD or None."""
+    if (old["width"], old["height"]) != (new["width"], new["height"]):
+        return REBUILD
+    if len(old["t_index_list"]) != len(new["t_index_list"]):
+        return REBUILD
+    if list(old["t_index_list"]) != list(new["t_index_list"]):
+        return PREPARE
+    if old["similar_image_filter_threshold"] != new["similar_image_filter_threshold"]:
+        return THRESHOLD
+    return None
+
+
+class QualityGovernor:
+    """
+    Holds a target frame rate by stepping through a ladder of quality settings.
+
+    `ladder` runs from best to cheapest; each entry is a dict of overrides on `base`
+    (`width`, `height`, `t_index_list`, `similar_image_filter_threshold`). Feed it the
+    measured time of every frame the model actually rendered with `record()`. When
+    the mean over the last `window` frames is below `target_fps * down_margin` it
+    steps one level down; when it is above `target_fps * up_margin` for `hold` frames
+    it tries one level up.
+
+    Hysteresis keeps it from oscillating: the gap between the two margins, a `settle`
+    period after every change (so warmup and rebuild frames are not judged), and a
+    hold before stepping up again that doubles each time a step up had to be undone.
+
+    Example Usage:
+    --------------
+    ```python
+    governor = QualityGovernor(base, ladder, target_fps=12)
+
+    while True:
+        start_time = time.time()
+        ...  # one frame
+        if governor.record(time.time() - start_time):
+            old, new = governor.previous, governor.settings
+            if change_kind(old, new) == REBUILD:
+                stream = build_stream(new)
+    ```
+    """
+
+    def __init__(self, base, ladder, target_fps, window=30, down_margin=0.9, up_margin=1.2, settle=20, hold=60):
+        self.ladder = [{**base, **overrides} for overrides in ladder] or [dict(base)]
+        self.target_fps = target_fps
+        self.down_margin = down_margin
+        self.up_margin = up_margin
+        self.settle = settle
+        self.frame_times = deque(maxlen=window)
+        self.hold = [hold] * len(self.ladder)  # frames of headroom needed before stepping up to a level
+        self.level = 0
+        self.previous = None
+        self.skip = settle
+        self.headroom = 0  # consecutive frames with fps above the up margin
+        self.stepped_up = False
+        self.changes = 0
+
+    @property
+    def settings(self):
+        return self.ladder[self.level]
+
+    def fps(self):
+        """Mean frame rate over the window, or None until the window is full."""
+        if len(self.frame_times) < self.frame_times.maxlen:
+            return None
+        return len(self.frame_times) / sum(self.frame_times)
+
+    def record(self, frame_time):
+        """Add one frame's duration in seconds. Returns True when the level has changed."""
+        if self.skip:
+            self.skip -= 1
+            return False
+        self.frame_times.append(frame_time)
+        fps = self.fps()
+        if fps is None:
+            return False
+        if fps < self.target_fps * self.down_margin and self.level < len(self.ladder) - 1:
+            if self.stepped_up:
+                self.hold[self.level] *= 2  # that level could not hold the target; wait longer next time
+            return self._change(self.level + 1, stepped_up=False)
+        self.stepped_up = False
+        if fps > self.target_fps * self.up_margin and self.level > 0:
+            self.headroom += 1
+            if self.headroom >= self.hold[self.level - 1]:
+                return self._change(self.level - 1, stepped_up=True)
+        else:
+            self.headroom = 0
+        return False
+
+    def _change(self, level, stepped_up):
+        self.previous = self.settings
+        self.level = level
+        self.stepped_up = stepped_up
+        self.frame_times.clear()
+        self.skip = self.settle
+        self.headroom = 0
+        self.changes += 1
+        return True
@@ -0,0 +1,227 @@
+# GPU-free benchmark of the realtime img2img loops
+#
+# Runs the hot path of each loop (realtime_loops.py, the code the scripts run)
+# against a synthetic or recorded frame source, a CPU stand-in
+# for the model with a fixed latency, and a sink that discards frames. Prints frames
+# per second and per-stage cost for each loop variant, so changes to our own code
+# can be compared on any Linux box without a GPU, a camera or Spout.
+#
+# pip install torch opencv-python pillow numpy fire
+#
+# python realtime-benchmark.py                              # all variants, 200 frames
+# python realtime-benchmark.py --variants=min-serial,ring   # just these
+# python realtime-benchmark.py --latency=0.03 --video=clip.mp4 --camera_fps=30
+#
+# The camera is paced (60 fps by default, faster than the stub model) as a real one
+# is. With --camera_fps=0 frames are always ready, and the capture stages of the
+# threaded variants spin on drop-oldest hand-offs, which mostly measures GIL contention.
+
+import time
+import threading
+from multiprocessing import get_context
+from types import SimpleNamespace
+import numpy as np
+import torch
+import cv2
+import fire
+
+from stage_metrics import StageMetrics
+from frame_ring_buffer import FrameRingBuffer
+from frame_transport import SharedFrameTransport
+from frame_convert import FrameConverter
+from realtime_loops import StreamLoop, RingBufferLoop, capture_frames, run_sdturbo as sdturbo_loop
+
+VARIANTS = ["min-serial", "min-pipelined", "ring", "sdturbo"]
+
+
+class FrameSource:
+    """
+    Stands in for `cv2.VideoCapture`: `read()` returns `(True, frame)` with a uint8 BGR
+    frame. Frames are generated (moving noise, so no two are alike) or loaded from a
+    recorded video, all up front, then looped. With `fps` set, `read()` blocks until
+    the next frame is due, like a real camera; with 0 it only yields the GIL.
+    """
+
+    def __init__(self, width, height, fps=0, video=None, frames=60):
+        if video:
+            self.frames = self._load(video, width, height, frames)
+        else:
+            rng = np.random.default_rng(0)
+            base = rng.integers(0, 256, (height, width * 2, 3), dtype=np.uint8)
+            step = max(1, width // frames)
+            self.frames = [np.ascontiguousarray(base[:, i * step:i * step + width]) for i in range(frames)]
+        self.interval = 1 / fps if fps else 0
+        self.next_time = time.perf_counter()
+        self.index = 0
+
+    @staticmethod
+    def _load(video, width, height, limit):
+        cap = cv2.VideoCapture(video)
+        frames = []
+        while len(frames) < limit:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(cv2.resize(frame, (width, height)))
+        cap.release()
+        if not frames:
+            raise ValueError(f"No frames could be read from {video}")
+        return frames
+
+    def read(self):
+        if self.interval:
+            delay = self.next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_time = max(self.next_time + self.interval, time.perf_counter())
+        else:
+            time.sleep(0)  # a real camera blocks; without it the reading thread starves the others of the GIL
+        frame = self.frames[self.index]
+        self.index = (self.index + 1) % len(self.frames)
+        return True, frame
+
+    def release(self):
+        pass
+
+
+class StubStreamDiffusion:
+    """
+    A CPU stand-in for `StreamDiffusionWrapper`. `stream(batch)` sleeps for `latency`
+    seconds (the model) and returns an image batch of the same shape, as a new tensor
+    in [-1, 1] like the real (raw VAE) output.
+    """
+
+    def __init__(self, latency=0.05, device="cpu", dtype=torch.float32):
+        self.latency = latency
+        self.device = torch.device(device)
+        self.dtype = dtype
+
+    def stream(self, input_batch):
+        time.sleep(self.latency)
+        return input_batch.mul(2).sub_(1)
+
+
+class StubImg2ImgPipeline:
+    """A CPU stand-in for the diffusers pipeline in webcam2sdturbo2spout.py."""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+
+    def __call__(self, prompt, image, **kwargs):
+        time.sleep(self.latency)
+        return SimpleNamespace(images=image.clamp(0, 1))
+
+
+class NullSender:
+    """Stands in for `SpoutSender`: takes the image in the form the loop sends and discards it."""
+
+    def __init__(self):
+        self.sent = 0
+
+    def send_image(self, image, flip):
+        np.asarray(image)  # the sender needs a contiguous array of the pixels
+        self.sent += 1
+
+
+# The loops themselves are realtime_loops.py, the same code the scripts run
+
+def run_min(source, model, sender, metrics, frames, pipelined=False, depth=1):
+    height, width = source.frames[0].shape[:2]
+    converter = FrameConverter(height, width, device=model.device, dtype=model.dtype, slots=depth + 2)
+    loop = StreamLoop(source, model, converter, sender, metrics, width, height)
+    if pipelined:
+        loop.run_pipelined(depth, frames=frames)
+    else:
+        loop.run_serial(frames)
+
+
+def run_ring(source, model, transport, metrics, frames, frame_buffer_size=1, capacity=16):
+    height, width = source.frames[0].shape[:2]
+    frame_buffer = FrameRingBuffer(max(capacity, frame_buffer_size), height, width)
+    converter = FrameConverter(height, width, device=model.device, dtype=model.dtype, batch=frame_buffer_size)
+    loop = RingBufferLoop([frame_buffer], converter, [transport], metrics, width, height, frame_buffer_size)
+    settings = {"width": width, "height": height}
+    event = threading.Event()
+    capture_thread = threading.Thread(target=capture_frames, args=(event, source, height, width, frame_buffer, metrics))
+    capture_thread.start()
+    sent = 0
+    while sent < frames:
+        if loop.step(model, settings) is not None:
+            sent += 1
+    event.set()
+    capture_thread.join()
+
+
+def run_sdturbo(source, pipe, sender, metrics, frames, device="cpu", dtype=torch.float32):
+    height, width = source.frames[0].shape[:2]
+    converter = FrameConverter(height, width, device=device, dtype=dtype)
+    sdturbo_loop(source, pipe, converter, sender, metrics, width, height, "frog people", frames)
+
+
+def run_variant(variant, source, latency, frames, warmup):
+    model = StubStreamDiffusion(latency)
+    height, width = source.frames[0].shape[:2]
+    transport = None
+    if variant == "min-serial":
+        run = lambda metrics, n: run_min(source, model, NullSender(), metrics, n)
+    elif variant == "min-pipelined":
+        run = lambda metrics, n: run_min(source, model, NullSender(), metrics, n, pipelined=True)
+    elif variant == "ring":
+        transport = SharedFrameTransport(get_context("spawn"), (1, 3, height, width))
+        run = lambda metrics, n: run_ring(source, model, transport, metrics, n)
+    elif variant == "sdturbo":
+        run = lambda metrics, n: run_sdturbo(source, StubImg2ImgPipeline(latency), NullSender(), metrics, n)
+    else:
+        raise ValueError(f"Unknown variant: {variant} (choose from {', '.join(VARIANTS)})")
+
+    metrics = StageMetrics(window=max(frames, 512))
+    try:
+        if warmup:
+            run(StageMetrics(), warmup)  # warmup samples are discarded
+        start_time = time.perf_counter()
+        run(metrics, frames)
+        elapsed = time.perf_counter() - start_time
+    finally:
+        if transport is not None:
+            transport.unlink()
+    return frames / elapsed, metrics.snapshot()
+
+
+def print_report(variant, fps, snapshot, latency):
+    overhead_ms = 1000 / fps - 1000 * latency
+    print(f"\n{variant}: {fps:.1f} fps ({overhead_ms:+.2f} ms/frame vs the model alone)")
+    print(f"  {'stage':<12} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, stats in snapshot["stages"].items():
+        print(
+            f"  {stage:<12} {stats['mean_ms']:9.3f} {stats['p50_ms']:9.3f}"
+            f" {stats['p95_ms']:9.3f} {stats['p99_ms']:9.3f}"
+        )
+    for name, value in snapshot["counters"].items():
+        print(f"  {name}: {value}")
+
+
+def main(
+    variants: str = ",".join(VARIANTS),
+    frames: int = 200,
+    warmup: int = 10,
+    width: int = 512,
+    height: int = 512,
+    latency: float = 0.02,
+    camera_fps: float = 60,
+    video: str = None,
+    threads: int = 0,
+):
+    if threads:
+        torch.set_num_threads(threads)
+    if isinstance(variants, str):
+        variants = variants.split(",")
+    source = FrameSource(width, height, fps=camera_fps, video=video)
+    print(f"{width}x{height}, stub model latency {1000 * latency:.1f} ms, "
+          f"camera {'unpaced' if not camera_fps else f'{camera_fps} fps'}, {frames} frames per variant")
+    for variant in variants:
+        fps, snapshot = run_variant(variant, source, latency, frames, warmup)
+        print_report(variant, fps, snapshot, latency)
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,271 @@
+import time
+import queue
+import threading
+import cv2
+import torch.nn.functional as F
+
+from stage_pipeline import start_stage, put_latest
+from frame_interpolator import FrameInterpolator
+
+
+class StreamLoop:
+    """
+    The per-frame path of stream-diffusion-min.py: camera frame in, StreamDiffusion,
+    uint8 image out to the sink. Run it one frame at a time (`run_serial`) or as
+    overlapping threads (`run_pipelined`).
+
+    The scripts and realtime-benchmark.py both drive this class, with the real
+    camera, model and Spout sender or with stand-ins, so the benchmark always
+    measures the code that ships.
+
+    Example Usage:
+    --------------
+    ```python
+    converter = FrameConverter(512, 512, device="cuda", dtype=torch.float16, slots=3)
+    loop = StreamLoop(cap, sdw, converter, sender, metrics, 512, 512)
+    loop.run_pipelined(depth=1)  # until Ctrl+C
+    ```
+
+    `model.stream(batch)` is the model (`StreamDiffusionWrapper.stream`), returning
+    its raw [-1, 1] output; `cap.read()` and `sender.send_image(image, flip)` are
+    the `cv2.VideoCapture` and `SpoutSender` calls. Give `converter` at least
+    `depth + 2` slots when pipelining.
+    """
+
+    def __init__(self, cap, model, converter, sender, metrics, width, height):
+        self.cap = cap
+        self.model = model
+        self.converter = converter
+        self.sender = sender
+        self.metrics = metrics
+        self.width = width
+        self.height = height
+
+    def read_frame(self):
+        with self.metrics.time("capture"):
+            ret, frame = self.cap.read()
+        if not ret:
+            time.sleep(0.01)  # Prevent CPU overuse
+            return None
+        return frame
+
+    def preprocess(self, frame):
+        with self.metrics.time("preprocess"):
+            if frame.shape[0] != self.height or frame.shape[1] != self.width:
+                frame = cv2.resize(frame, (self.width, self.height))
+
+        # Upload as uint8 (1, C, H, W); BGR -> RGB and [0,1] happen on the GPU
+        with self.metrics.time("h2d"):
+            return self.converter.to_tensor(frame)
+
+    def infer(self, input_batch):
+        # Stream through model (stays on GPU)
+        with self.metrics.time("stream"):
+            return self.model.stream(input_batch)
+
+    def postprocess(self, output_images):
+        # Scale to uint8 HWC on the GPU, one copy into a reused host array for Spout
+        with self.metrics.time("d2h"):
+            return self.converter.to_numpy(output_images[0], denormalize=True)  # the raw VAE output is in [-1, 1]
+
+    def send(self, output_image):
+        with self.metrics.time("send"):
+            self.sender.send_image(output_image, False)
+
+    def count_dropped(self, n):
+        self.metrics.count("dropped", n)
+
+    def run_serial(self, frames=None):
+        """Process one frame at a time, `frames` of them or until Ctrl+C."""
+        sent = 0
+        try:
+            while frames is None or sent < frames:
+                frame = self.read_frame()
+                if frame is None:
+                    continue
+                self.send(self.postprocess(self.infer(self.preprocess(frame))))
+                sent += 1
+        except KeyboardInterrupt:
+            pass
+
+    def run_pipelined(self, depth=1, interpolate_fps=0, interpolate_mode="blend", frames=None):
+        """
+        Run the stages as overlapping threads until `frames` have been sent or Ctrl+C.
+        With `interpolate_fps`, in-between frames are sent at that rate.
+        """
+        # Each stage runs in its own thread so the GPU works on frame N while
+        # frame N+1 is captured and frame N-1 is sent. Hand-offs into inference
+        # keep only the newest frame; after it they block, so nothing runs ahead.
+        # Sending stays on the calling thread, which owns the Spout sender.
+        stop_event = threading.Event()
+        captured = queue.Queue(maxsize=depth)
+        prepared = queue.Queue(maxsize=depth)
+        generated = queue.Queue(maxsize=depth)
+        finished = queue.Queue(maxsize=depth)
+        threads = []
+        threads += start_stage(self.read_frame, None, captured, stop_event, drop_oldest=True, on_drop=self.count_dropped)
+        threads += start_stage(self.preprocess, captured, prepared, stop_event, drop_oldest=True, on_drop=self.count_dropped)
+        threads += start_stage(self.infer, prepared, generated, stop_event)
+        interpolator = None
+        if interpolate_fps:
+            # Model outputs go to the interpolator, which fills `finished` at the display rate
+            interpolator = FrameInterpolator(
+                lambda frame: put_latest(finished, frame), interpolate_fps, interpolate_mode, slots=depth + 2
+            )
+            threads.append(interpolator.start())
+            threads += start_stage(lambda output: interpolator.push(self.postprocess(output)), generated, None, stop_event)
+        else:
+            threads += start_stage(self.postprocess, generated, finished, stop_event)
+        sent = 0
+        try:
+            while frames is None or sent < frames:
+                try:
+                    self.send(finished.get(timeout=1))
+                    sent += 1
+                except queue.Empty:
+                    continue
+        except KeyboardInterrupt:
+            pass
+        stop_event.set()
+        if interpolator is not None:
+            interpolator.stop_event.set()
+        for thread in threads:
+            thread.join()
+
+
+def capture_frames(event, cap, height, width, frame_buffer, metrics, stage="capture"):
+    """Read `cap` into `frame_buffer` until `event` is set (stream-diffusion.py's capture thread)."""
+    while not event.is_set():
+        with metrics.time(stage):
+            ret, frame = cap.read()
+        if not ret:
+            continue
+        if frame.shape[0] != height or frame.shape[1] != width:
+            frame = cv2.resize(frame, (width, height))
+        frame_buffer.write(frame)  # raw BGR, converted only if sampled
+    cap.release()
+
+
+class RingBufferLoop:
+    """
+    The per-frame path of stream-diffusion.py: sample the newest frames from each
+    camera's ring buffer, run them through StreamDiffusion as one batch, and hand
+    each output to its camera's transport, or to its interpolator.
+
+    With one camera the batch holds its last `frame_buffer_size` frames; with
+    several, `frame_buffer_size` is the number of cameras and batch position i is
+    always camera i, so each keeps its own lane through the denoising batch and its
+    own sink. When the model runs at a smaller size than the cameras (a quality
+    governor setting), frames are resized on the device both ways, so capture,
+    transport and viewer stay at full size.
+
+    Example Usage:
+    --------------
+    ```python
+    loop = RingBufferLoop(frame_buffers, converter, queues, metrics, 512, 512, frame_buffer_size)
+
+    while True:
+        result = loop.step(stream, settings)
+        if result is not None:
+            frame_time, rendered = result
+    ```
+
+    As with `StreamLoop`, realtime-benchmark.py runs this same code against stand-ins.
+    """
+
+    def __init__(self, frame_buffers, converter, sinks, metrics, width, height, frame_buffer_size,
+                 interpolators=None, sync=None):
+        self.frame_buffers = frame_buffers
+        self.converter = converter
+        self.sinks = sinks  # SharedFrameTransport per camera
+        self.metrics = metrics
+        self.width = width
+        self.height = height
+        self.frame_buffer_size = frame_buffer_size
+        self.interpolators = interpolators or [None] * len(sinks)
+        self.sync = sync  # e.g. torch.cuda.synchronize, to charge GPU stages for their device time
+        self.multi_source = len(frame_buffers) > 1
+        self.lanes = list(range(len(frame_buffers))) if self.multi_source else [0] * frame_buffer_size
+        self.labels = [str(i) for i in range(len(frame_buffers))] if self.multi_source else [""]
+        self.started = [False] * len(frame_buffers)  # a source's lane is used once it has sent a frame
+        self.previous_output = None  # clear when the model or its settings change
+
+    def step(self, stream, settings):
+        """
+        Run one batch through `stream` (a `StreamDiffusionWrapper`) at `settings`'
+        width and height. Returns `(frame_time, rendered)`, where `rendered` is False
+        if the similar image filter reused the last result, or None when no camera
+        had a new frame.
+        """
+        # Sampled frames are copied straight into the converter's pinned staging buffer
+        staging = self.converter.input_buffer(self.frame_buffer_size)
+        if self.multi_source:
+            # A camera with no new frame keeps its previous one in its row
+            fresh = [
+                frame_buffer.take_latest(1, out=staging[i:i + 1]) is not None
+                for i, frame_buffer in enumerate(self.frame_buffers)
+            ]
+            self.started = [s or f for s, f in zip(self.started, fresh)]
+            ready = any(fresh) and all(self.started)
+        else:
+            ready = self.frame_buffers[0].take_latest(self.frame_buffer_size, out=staging) is not None
+        if not ready:
+            time.sleep(0.005)
+            return None
+        start_time = time.time()
+        with self.metrics.time("h2d", self.sync):
+            input_batch = self.converter.upload(self.frame_buffer_size)
+            if settings["width"] != self.width or settings["height"] != self.height:
+                # Capture, transport and viewer stay at full size; only the model runs smaller
+                input_batch = F.interpolate(input_batch, size=(settings["height"], settings["width"]), mode="bilinear")
+        with self.metrics.time("stream", self.sync):
+            output = stream.stream(input_batch)
+        rendered = output is not self.previous_output
+        if not rendered:
+            self.metrics.count("skipped")  # similar image filter reused the last result
+        self.previous_output = output
+        if output.shape[-2:] != (self.height, self.width):
+            output = F.interpolate(output.reshape(-1, 3, *output.shape[-2:]), size=(self.height, self.width), mode="bilinear")
+        with self.metrics.time("d2h"):
+            output_images = output.cpu()
+        if self.frame_buffer_size == 1:
+            output_images = [output_images]
+        with self.metrics.time("send"):
+            for lane, output_image in zip(self.lanes, output_images):
+                interpolator = self.interpolators[lane]
+                if interpolator is not None:
+                    # float32: OpenCV has no float16 kernels for blending or resizing
+                    interpolator.push(output_image.reshape(-1, self.height, self.width).permute(1, 2, 0).float().numpy())
+                else:
+                    self.sinks[lane].put(output_image, block=False)
+        for label, frame_buffer, sink, interpolator in zip(self.labels, self.frame_buffers, self.sinks, self.interpolators):
+            self.metrics.set_counter(f"camera{label}_dropped", frame_buffer.dropped)
+            self.metrics.set_counter(f"output{label}_dropped", sink.stats()["dropped"])
+            if interpolator is not None:
+                self.metrics.set_counter(f"interpolated{label}", interpolator.interpolated)
+        return time.time() - start_time, rendered
+
+
+def run_sdturbo(cap, pipe, converter, sender, metrics, width, height, prompt, frames=None):
+    """
+    webcam2sdturbo2spout.py's loop: frames go to the diffusers pipeline as tensors
+    and come back as tensors ("pt"), so the only host copies are the upload and the
+    download, with no PIL images in between. Runs for `frames` frames or forever.
+    """
+    sent = 0
+    while frames is None or sent < frames:
+        with metrics.time("capture"):
+            ret, frame = cap.read()
+        if not ret:
+            continue
+        with metrics.time("h2d"):
+            if frame.shape[0] != height or frame.shape[1] != width:
+                frame = cv2.resize(frame, (width, height))
+            image = converter.to_tensor(frame)
+        with metrics.time("stream"):
+            image = pipe(prompt, image=image, num_inference_steps=2, strength=0.5, guidance_scale=0.0, output_type="pt").images[0]
+        with metrics.time("d2h"):
+            image = converter.to_numpy(image, bgr=True)  # BGR, as the cv2 round trip sent before
+        with metrics.time("send"):
+            sender.send_image(image, False)
+        sent += 1
@@ -1,17 +1,24 @@
-import requests
 import json
 import os
 from pydub import AudioSegment
 import base64
 import uuid
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from api_client import metrics, transcribe_audio, reprocess_text_with_ollama, stream_text_with_ollama, txt2img
+from prompt_stream import PromptStreamParser
 
-# Configuration
-WHISPER_API_URL = "http://localhost:8080/inference"  # Updated for correct endpoint
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
-OLLAMA_MODEL = "llama3.2"  # Change based on available models
-STABLE_DIFFUSION_URL = "http://localhost:7860/sdapi/v1/txt2img"  # Adjust if needed
+# Configuration: service URLs, models, timeouts and retries are in api_client.py
 
+# Stream the Ollama response and start each image as soon as its prompt is complete
+STREAMING = True
+
+# Image requests in flight at once. Repeated prompts are packed into one request
+# with batch_size instead, since every request uses the same settings. 1 runs the
+# serial loop, one request per prompt, to measure its time for comparison.
+SD_CONCURRENCY = 2
 
 # Function to convert audio to WAV (Whisper.cpp prefers WAV)
 def convert_audio_to_wav(input_audio_path, output_wav_path):
@@ -19,24 +26,6 @@ def convert_audio_to_wav(input_audio_path, output_wav_path):
     audio.export(output_wav_path, format="wav")
     return output_wav_path
 
-# Function to transcribe audio using Whisper.cpp
-def transcribe_audio(audio_path):
-    with open(audio_path, "rb") as f:
-        response = requests.post(
-            WHISPER_API_URL,
-            files={"file": f},  # Corrected field name
-            data={"temperature": "0.0", "temperature_inc": "0.2", "response_format": "json"},
-        )
-
-    print("Whisper API Response:", response.status_code)  # Print status code
-
-    if response.status_code == 200:
-        response_json = response.json()
-        #print("Full Whisper API Response:", json.dumps(response_json, indent=2))  # Print full JSON response
-        return response_json.get("text", "").strip()  # Extract transcription
-    else:
-        raise Exception(f"Whisper API error: {response.text}")
-
 import re
 
 def strip_triple_backticks(text):
@@ -56,22 +45,34 @@ def strip_triple_backticks(text):
     return cleaned_text
 
 
-# Function to process text with Ollama
-def reprocess_text_with_ollama(text, guiding_prompt):
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": f"{guiding_prompt}\n\n{text}",
-        "stream": False  # Set to True for streaming responses
-    }
+class RequestTimings:
+    """
+    Start and end times of image requests, to compare a run against the serial loop.
 
-    #print(f"llama prompt: {guiding_prompt}\n\n{text}")
-    
-    response = requests.post(OLLAMA_API_URL, json=payload)
+    The report gives the wall time and the sum of the request durations. That sum is
+    not the serial loop's time: under concurrency a request's duration includes time
+    queued behind the others on the server, and a batched request stands in for
+    several. Set SD_CONCURRENCY = 1 to measure the serial loop itself.
+    """
 
-    if response.status_code == 200:
-        return response.json().get("response", "").strip()
-    else:
-        raise Exception(f"Ollama API error: {response.text}")
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = []
+
+    def add(self, start_time, end_time):
+        with self.lock:
+            self.spans.append((start_time, end_time))
+
+    def report(self, images):
+        with self.lock:
+            spans = list(self.spans)
+        if not spans:
+            return
+        request_time = sum(end_time - start_time for start_time, end_time in spans)
+        wall_time = max(end_time for _, end_time in spans) - min(start_time for start_time, _ in spans)
+        print(f"Generated {images} images in {len(spans)} requests: {wall_time:.1f}s wall time, "
+              f"{request_time:.1f}s summed over requests (includes queueing; "
+              f"SD_CONCURRENCY = 1 measures the serial loop)")
 
 
 def generate_unique_filename():
@@ -79,7 +80,8 @@ def generate_unique_filename():
     unique_id = uuid.uuid4().hex  # Generate a unique ID
     return f"{unique_id}"
 
-def generate_sd_image(prompt, output_folder="generated_images"):
+def generate_sd_batch(prompt, count=1, output_folder="generated_images", timings=None):
+    """Generates `count` images of one prompt in a single request. Returns their paths."""
     os.makedirs(output_folder, exist_ok=True)  # Ensure output folder exists
 
     payload = {
@@ -88,25 +90,59 @@ def generate_sd_image(prompt, output_folder="generated_images"):
         "cfg_scale": 7.5,  # Adjust as needed
         "width": 512,  # Adjust as needed
         "height": 512,  # Adjust as needed
-        "sampler_index": "Euler a"
+        "sampler_index": "Euler a",
+        "batch_size": count
     }
 
-    response = requests.post(STABLE_DIFFUSION_URL, json=payload)
-    
-    if response.status_code == 200:
-        result = response.json()
-        images = result.get("images", [])
-        if images:
-            # Convert base64 image to file
-            img_data = images[0]
-            filename = generate_unique_filename()
-            img_path = os.path.join(output_folder, f"{filename}.png")
-            with open(img_path, "wb") as f:
-                f.write(base64.b64decode(img_data))
-            print(f"Saved: {img_path}")
-            return img_path
+    start_time = time.perf_counter()
+    images = txt2img(payload)
+    if timings is not None:
+        timings.add(start_time, time.perf_counter())
+
+    img_paths = []
+    for img_data in images[:count]:
+        # Convert base64 image to file
+        filename = generate_unique_filename()
+        img_path = os.path.join(output_folder, f"{filename}.png")
+        with open(img_path, "wb") as f:
+            f.write(base64.b64decode(img_data))
+        print(f"Saved: {img_path}")
+        img_paths.append(img_path)
+    return img_paths
+
+def generate_sd_image(prompt, output_folder="generated_images", timings=None):
+    img_paths = generate_sd_batch(prompt, 1, output_folder, timings)
+    if img_paths:
+        return img_paths[0]
+
+def generate_sd_images(prompts, output_folder="generated_images", concurrency=SD_CONCURRENCY):
+    """
+    Generates one image per prompt, with up to `concurrency` requests in flight and
+    repeated prompts packed into one batched request. Returns the image paths in
+    prompt order (None where a request returned no image). With `concurrency` 1 it is
+    the serial loop: one request per prompt, one after another.
+    """
+    # (prompt, positions it appears at), in first-seen order
+    if concurrency == 1:
+        groups = [(prompt, [index]) for index, prompt in enumerate(prompts)]
     else:
-        raise Exception(f"Stable Diffusion API error: {response.text}")
+        positions = {}
+        for index, prompt in enumerate(prompts):
+            positions.setdefault(prompt, []).append(index)
+        groups = list(positions.items())
+
+    timings = RequestTimings()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(generate_sd_batch, prompt, len(indices), output_folder, timings)
+            for prompt, indices in groups
+        ]
+    img_paths = [None] * len(prompts)
+    for (prompt, indices), future in zip(groups, futures):
+        for index, img_path in zip(indices, future.result()):
+            img_paths[index] = img_path
+    timings.report(len(prompts))
+    return img_paths
     
 # Main function
 def process_audio(input_audio_path, guiding_prompt, image_prompt):
@@ -118,6 +154,11 @@ def process_audio(input_audio_path, guiding_prompt, image_prompt):
     print("Transcription:", transcription)
 
     print("Reprocessing text with Ollama...")
+    if STREAMING:
+        reprocessed_text = stream_prompts(transcription, guiding_prompt, image_prompt)
+        os.remove(wav_path)
+        return reprocessed_text
+
     reprocessed_text = reprocess_text_with_ollama(transcription, guiding_prompt)
     print("Raw: ", reprocessed_text)
     reprocessed_text = strip_triple_backticks(reprocessed_text)
@@ -132,15 +173,39 @@ def process_audio(input_audio_path, guiding_prompt, image_prompt):
 
     print(f"Generating {len(sd_prompt)} images with Stable Diffusion...")
 
-    # Process each prompt with Stable Diffusion
+    # Process the prompts with Stable Diffusion, several at a time
     for prompt in sd_prompt:
         print(f"   - {prompt}")
-        generate_sd_image(f"{image_prompt} {prompt}")
+    img_paths = generate_sd_images([f"{image_prompt} {prompt}" for prompt in sd_prompt])
+    print("Images:", img_paths)
 
     # Cleanup temporary file
     os.remove(wav_path)
     return reprocessed_text
 
+def stream_prompts(transcription, guiding_prompt, image_prompt):
+    """
+    Streams the Ollama response, handing each sd-prompt to Stable Diffusion as soon
+    as it is complete. Images are generated on up to SD_CONCURRENCY worker threads
+    so the stream keeps being read meanwhile. Returns the full response text.
+    """
+    parser = PromptStreamParser()
+    pieces = []
+    futures = []
+    timings = RequestTimings()
+    with ThreadPoolExecutor(max_workers=SD_CONCURRENCY) as images:
+        for piece in stream_text_with_ollama(transcription, guiding_prompt):
+            pieces.append(piece)
+            for prompt in parser.feed(piece):
+                print(f"   - {prompt}")
+                futures.append(images.submit(generate_sd_image, f"{image_prompt} {prompt}", timings=timings))
+    img_paths = [future.result() for future in futures]  # in prompt order; re-raises failed requests
+    print("Images:", img_paths)
+    reprocessed_text = "".join(pieces).strip()
+    print("Raw: ", reprocessed_text)
+    timings.report(len(parser.prompts))
+    return reprocessed_text
+
 
     
 # Example usage
@@ -153,3 +218,4 @@ if __name__ == "__main__":
     output_text = process_audio(input_audio, guiding_prompt, image_prompt)
     
     print("\nFinal Output:\n", output_text)
+    print("\nRequest timings:\n", json.dumps(metrics.snapshot()["stages"], indent=2))
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import threading
+
+
+class ResultCache:
+    """
+    A persistent, content-addressed cache of processed results on disk.
+
+    Entries are keyed by a SHA-256 of the input bytes plus the parameters that
+    produced the result, so re-running a job skips any input it has already seen
+    with the same settings, and an interrupted job resumes where it stopped. Each
+    entry is written to a temporary file and renamed into place, so a crash never
+    leaves a partial entry behind.
+
+    When the total size goes over `max_bytes`, the least recently used entries are
+    removed (reads refresh an entry's modification time).
+
+    Example Usage:
+    --------------
+    ```python
+    cache = ResultCache("sd_cache", max_bytes=2 * 1024**3)
+
+    key = cache.key(frame_bytes, prompt=prompt, strength=0.7, steps=50)
+    result = cache.get(key)
+    if result is None:
+        result = run_model(frame_bytes)
+        cache.put(key, result)
+    ```
+    """
+
+    def __init__(self, directory, max_bytes=2 * 1024**3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(size for _, _, size in self._entries())
+
+    @staticmethod
+    def key(data, **params):
+        """Key for `data` (bytes or str) processed with `params` (JSON-serialisable values)."""
+        digest = hashlib.sha256()
+        digest.update(data.encode("utf-8") if isinstance(data, str) else data)
+        digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _entries(self):
+        """(path, mtime, size) for every entry on disk."""
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def get(self, key):
+        """The cached bytes for `key`, or None."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """Store `data` under `key`, evicting old entries if the cache is over size."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self.lock:
+            self.total_bytes += len(data)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Drop least recently used entries until back under 90% of the limit
+        target = 0.9 * self.max_bytes
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self.total_bytes = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if self.total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= size
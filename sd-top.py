@@ -1,12 +1,17 @@
 # me - this DAT
 # scriptOp - the OP which is cooking
-import requests
+import os
+import sys
 import json
 import base64
 import numpy as np
 import cv2
 import numpy
 
+# api_client.py lives in the repo root, one level above the .toe
+sys.path.append(os.path.dirname(project.folder))
+from api_client import txt2img
+
 # Stable Diffusion API URL (local A1111 instance)
 SD_API_URL = "http://127.0.0.1:7860/sdapi/v1/txt2img"
 SCRIPT_TOP = "script2"
@@ -47,18 +52,14 @@ def send_prompt(prompt):
 	}
 
 	try:
-		response = requests.post(SD_API_URL, json=payload, timeout=5)
-	except:
-		print("Error: No response from the server.")
+		images = txt2img(payload, url=SD_API_URL, timeout=5, retry=False)  # never hold up the cook
+	except Exception as e:
+		print(f"Error: {e}")
 		return
 
-	if response.status_code == 200:
-		result = response.json()
-		image_data = result["images"][0]  # Base64 encoded image
-		image = convert_base64_to_nparray(image_data)
-		me.store("image_data", image)
-	else:
-		print(f"Error: {response.status_code} - {response.text}")
+	image_data = images[0]  # Base64 encoded image
+	image = convert_base64_to_nparray(image_data)
+	me.store("image_data", image)
 	
 
 def convert_base64_to_nparray(image_data):
@@ -1,10 +1,15 @@
 import os
 import cv2
-import requests
 import json
+import time
+import queue
 import base64
-from PIL import Image
-from io import BytesIO
+import threading
+import subprocess
+import numpy as np
+from api_client import metrics, img2img
+from stage_pipeline import ReorderBuffer, start_stage
+from result_cache import ResultCache
 
 # CONFIGURATION
 input_video = "input.mp4"
@@ -16,10 +21,24 @@ prompt = "A surreal painting of the scene, vibrant colors, dreamlike"  # Modify
 strength = 0.7  # How much modification from the input (0 = no change, 1 = completely different)
 steps = 50  # Sampling steps
 model = "stable-diffusion-v1-5"  # Change if using another model
+workers = 4  # img2img requests kept in flight at once
+max_retries = 2  # extra attempts for a frame that fails
+retry_backoff = 1.0  # seconds before the first retry, doubled after each one
+# Decode, process and encode without writing frames to disk (frames_dir and
+# processed_dir are only used when this is False)
+streaming = True
+# Processed frames are cached on disk by input frame + settings, so interrupted
+# or repeated runs only send frames they haven't seen (None to disable)
+cache_dir = "sd_cache"
+cache_max_bytes = 4 * 1024**3
+# Frames that differ from the last processed frame by less than this (mean
+# absolute difference of a 32x32 grayscale thumbnail, 0-1) reuse its output
+# instead of sending a request (None to disable)
+skip_threshold = 0.01
+max_consecutive_skips = 10  # always process at least one frame in this many + 1
 
-# Ensure directories exist
-os.makedirs(frames_dir, exist_ok=True)
-os.makedirs(processed_dir, exist_ok=True)
+# Marks a frame that reuses the previous frame's output
+REUSE_PREVIOUS = object()
 
 # Extract frames from video
 def extract_frames(video_path, output_folder):
@@ -40,9 +59,13 @@ def encode_image(image_path):
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode("utf-8")
 
-# Send request to Stable Diffusion WebUI
-def process_frame(image_path, prompt, strength, steps):
-    image_base64 = encode_image(image_path)
+# Encode a decoded frame for the API request without touching the disk
+def encode_frame(frame):
+    ok, png = cv2.imencode(".png", frame)
+    return base64.b64encode(png.tobytes()).decode("utf-8")
+
+# Send request to Stable Diffusion WebUI, returns the processed image file bytes
+def process_frame(image_base64, prompt, strength, steps):
     payload = {
         "init_images": [image_base64],
         "prompt": prompt,
@@ -51,32 +74,207 @@ def process_frame(image_path, prompt, strength, steps):
         "sampler_index": "Euler a",
         "cfg_scale": 7,
     }
-    response = requests.post(f"{sd_webui_url}/sdapi/v1/img2img", json=payload)
-    if response.status_code == 200:
-        response_data = response.json()
-        image_data = response_data["images"][0]
-        image = Image.open(BytesIO(base64.b64decode(image_data)))
-        return image
-    else:
-        print(f"Error processing frame: {response.text}")
+    try:
+        # Failed frames are retried by process_frame_with_retry, not the session
+        images = img2img(payload, url=f"{sd_webui_url}/sdapi/v1/img2img", retry=False)
+        return base64.b64decode(images[0])
+    except Exception as e:
+        print(f"Error processing frame: {e}")
         return None
 
-# Process all frames with Stable Diffusion
+# Small grayscale thumbnail used to spot held frames and static shots
+def frame_signature(frame):
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(frame, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32) / 255
+
+def frame_difference(signature_a, signature_b):
+    return float(np.mean(np.abs(signature_a - signature_b)))
+
+# Retry a frame a few times before giving up on it
+def process_frame_with_retry(name, image_base64, prompt, strength, steps):
+    for attempt in range(max_retries + 1):
+        if attempt:
+            time.sleep(retry_backoff * 2 ** (attempt - 1))
+            print(f"Retrying {name} (attempt {attempt + 1})")
+        processed_image = process_frame(image_base64, prompt, strength, steps)
+        if processed_image:
+            return processed_image
+    print(f"Giving up on {name}")
+    return None
+
+# Process frames with Stable Diffusion, several requests at a time.
+# `frames` yields (name, source), `encode(source)` gives the request's base64
+# image, `signature(source)` a thumbnail for duplicate detection, and
+# `write(name, image_bytes)` is called in frame order (with None for a frame
+# that failed).
+def run_frames(frames, encode, signature, write):
+    pending = queue.Queue()
+    stop_event = threading.Event()
+    # Frames handed to workers but not yet written; bounds the reorder buffer
+    in_flight = threading.BoundedSemaphore(2 * workers)
+
+    # Results arrive out of order, frames are written in order. A skipped
+    # frame comes after the frame it copies, so its output is already known.
+    last_image = None
+    write_errors = []  # e.g. ffmpeg went away; stops feeding new frames
+
+    def write_frame(seq, result):
+        nonlocal last_image
+        name, processed_image = result
+        if processed_image is REUSE_PREVIOUS:
+            processed_image = last_image
+        else:
+            last_image = processed_image
+        try:
+            if not write_errors:
+                write(name, processed_image)
+        except Exception as e:
+            print(f"Error writing {name}: {e}")
+            write_errors.append(e)
+        finally:
+            in_flight.release()  # always, or run_frames would wait for this frame forever
+
+    order = ReorderBuffer(write_frame)
+    cache = ResultCache(cache_dir, cache_max_bytes) if cache_dir else None
+
+    def process(name, source):
+        image_base64 = encode(source)
+        if cache is None:
+            return process_frame_with_retry(name, image_base64, prompt, strength, steps)
+        key = cache.key(image_base64, prompt=prompt, strength=strength, steps=steps, model=model)
+        processed_image = cache.get(key)
+        if processed_image is None:
+            processed_image = process_frame_with_retry(name, image_base64, prompt, strength, steps)
+            if processed_image:
+                try:
+                    cache.put(key, processed_image)
+                except OSError as e:
+                    print(f"Error caching {name}: {e}")
+        return processed_image
+
+    def work(item):
+        # Every frame must reach the reorder buffer, even if it failed, or the
+        # frames after it are held back and run_frames never finishes
+        seq, name, source = item
+        try:
+            processed_image = process(name, source)
+        except Exception as e:
+            print(f"Error processing {name}: {e}")
+            processed_image = None
+        order.push(seq, (name, processed_image))
+
+    start_stage(work, pending, None, stop_event, workers=workers, name="img2img")
+    start_time = time.time()
+    frame_count = 0
+    skipped = 0
+    reference = None  # signature of the last frame sent for processing
+    consecutive_skips = 0
+    for seq, (name, source) in enumerate(frames):
+        in_flight.acquire()
+        if write_errors:
+            in_flight.release()
+            break
+        frame_count += 1
+        if skip_threshold is not None:
+            current = signature(source)
+            if (reference is not None and consecutive_skips < max_consecutive_skips
+                    and frame_difference(current, reference) <= skip_threshold):
+                consecutive_skips += 1
+                skipped += 1
+                order.push(seq, (name, REUSE_PREVIOUS))
+                continue
+            reference = current
+            consecutive_skips = 0
+        pending.put((seq, name, source))
+    for _ in range(2 * workers):
+        in_flight.acquire()  # wait for the last frames to be written
+    stop_event.set()
+    elapsed = time.time() - start_time
+    if write_errors:
+        raise write_errors[0]
+    print(f"Processing complete: {frame_count} frames in {elapsed:.1f}s with {workers} workers.")
+    if cache is not None:
+        print(f"Cache: {cache.hits} frames reused, {cache.misses} processed.")
+    if skip_threshold is not None:
+        print(f"Near-duplicate frames: {skipped} of {frame_count} reused the previous output, saving {skipped} requests.")
+    print(f"Request timings: {metrics.snapshot()['stages']}")
+
+# Process all extracted frames from frames_dir into processed_dir
 def process_frames():
     frame_files = sorted(os.listdir(frames_dir))
-    for frame_file in frame_files:
-        frame_path = os.path.join(frames_dir, frame_file)
-        processed_image = process_frame(frame_path, prompt, strength, steps)
+
+    def write_frame(frame_file, processed_image):
         if processed_image:
-            processed_image.save(os.path.join(processed_dir, frame_file))
-    print("Processing complete.")
+            with open(os.path.join(processed_dir, frame_file), "wb") as f:
+                f.write(processed_image)
+
+    frames = ((frame_file, os.path.join(frames_dir, frame_file)) for frame_file in frame_files)
+    def signature(frame_path):
+        return frame_signature(cv2.imread(frame_path, cv2.IMREAD_REDUCED_GRAYSCALE_4))
+
+    run_frames(frames, encode_image, signature, write_frame)
 
 # Reassemble frames into a video
 def create_video(output_video, frame_rate=30):
     os.system(f'ffmpeg -framerate {frame_rate} -i {processed_dir}/frame_%05d.png -c:v libx264 -pix_fmt yuv420p {output_video}')
     print(f"Output video saved as {output_video}")
 
+# Decode, process and encode in one pass: frames are read from the video in
+# memory and results are piped to ffmpeg as raw frames at the source frame rate
+def process_video_streaming(video_path, output_video):
+    cap = cv2.VideoCapture(video_path)
+    frame_rate = cap.get(cv2.CAP_PROP_FPS) or 30
+    encoder = None
+    last_frame = None
+    leading_failures = 0  # failed frames before the first result, written once it arrives
+
+    def read_frames():
+        frame_count = 0
+        while cap.isOpened():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield f"frame_{frame_count:05d}", frame
+            frame_count += 1
+        cap.release()
+
+    def write_frame(name, processed_image):
+        nonlocal encoder, last_frame, leading_failures
+        if processed_image:
+            last_frame = cv2.imdecode(np.frombuffer(processed_image, dtype=np.uint8), cv2.IMREAD_COLOR)
+        elif last_frame is None:
+            # Nothing to repeat yet; keep the frame's place so the clip keeps its length and timing
+            print(f"No output yet for {name}, it will repeat the first result")
+            leading_failures += 1
+            return
+        else:
+            print(f"Repeating previous frame for {name}")
+        if encoder is None:
+            # The output size is only known once the first result arrives
+            height, width = last_frame.shape[:2]
+            encoder = subprocess.Popen(
+                ["ffmpeg", "-y", "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}",
+                 "-r", str(frame_rate), "-i", "-", "-c:v", "libx264", "-pix_fmt", "yuv420p", output_video],
+                stdin=subprocess.PIPE,
+            )
+            for _ in range(leading_failures):
+                encoder.stdin.write(last_frame.tobytes())
+        encoder.stdin.write(last_frame.tobytes())
+
+    run_frames(read_frames(), encode_frame, frame_signature, write_frame)
+    if encoder is not None:
+        encoder.stdin.close()
+        encoder.wait()
+        print(f"Output video saved as {output_video}")
+
 # Run the pipeline
-extract_frames(input_video, frames_dir)
-process_frames()
-create_video(output_video)
+if streaming:
+    process_video_streaming(input_video, output_video)
+else:
+    # Ensure directories exist
+    os.makedirs(frames_dir, exist_ok=True)
+    os.makedirs(processed_dir, exist_ok=True)
+    extract_frames(input_video, frames_dir)
+    process_frames()
+    create_video(output_video)
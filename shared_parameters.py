@@ -0,0 +1,110 @@
+import struct
+import time
+from multiprocessing import shared_memory
+
+_SEQ = struct.Struct("<Q")
+
+
+class SharedParameterStore:
+    """
+    Numeric control values in `multiprocessing.shared_memory`, readable from any number
+    of processes with no IPC messages and no pickling.
+
+    The layout is fixed when the store is created: a list of `(name, type)` pairs,
+    where type is a `struct` code such as `"d"` (float) or `"q"` (int). A single writer
+    (normally a `VariableHandler` given `shared_store=`) updates values under a seqlock:
+    it makes the sequence counter odd, writes, then makes it even again. Readers copy
+    all values and retry if the counter was odd or changed meanwhile, so they always
+    get a consistent set and never block the writer.
+
+    Example Usage:
+    --------------
+    ```python
+    # parent process
+    store = SharedParameterStore([("fader_0", "q"), ("fader_1", "q"), ("strength", "d")])
+    handler = VariableHandler(shared_store=store)
+    ctx.Process(target=worker, args=(store,)).start()
+
+    # worker process
+    def worker(store):
+        version = None
+        while True:
+            if store.changed_since(version):
+                version, values = store.read()  # {"fader_0": 64, ...}
+    ```
+
+    The creating process should call `unlink()` once every process is done with it.
+    """
+
+    def __init__(self, layout):
+        self.layout = [(name, code) for name, code in layout]
+        self.names = [name for name, _ in self.layout]
+        self.values_struct = struct.Struct("<" + "".join(code for _, code in self.layout))
+        self.shm = shared_memory.SharedMemory(create=True, size=_SEQ.size + self.values_struct.size)
+        self.owner = True
+        self._build_offsets()
+        _SEQ.pack_into(self.shm.buf, 0, 0)
+        self.values_struct.pack_into(self.shm.buf, _SEQ.size, *([0] * len(self.names)))
+
+    def _build_offsets(self):
+        # name -> (struct for the field, byte offset in the shared block, int or float)
+        self.fields = {}
+        offset = _SEQ.size
+        for name, code in self.layout:
+            field = struct.Struct("<" + code)
+            convert = int if code in "bBhHiIlLqQ" else float
+            self.fields[name] = (field, offset, convert)
+            offset += field.size
+
+    def __getstate__(self):
+        return {"layout": self.layout, "name": self.shm.name}
+
+    def __setstate__(self, state):
+        self.layout = state["layout"]
+        self.names = [name for name, _ in self.layout]
+        self.values_struct = struct.Struct("<" + "".join(code for _, code in self.layout))
+        self.shm = shared_memory.SharedMemory(name=state["name"])
+        self.owner = False
+        self._build_offsets()
+
+    def write(self, values):
+        """Write the entries of `values` that are in the layout. Single writer only."""
+        buf = self.shm.buf
+        seq = _SEQ.unpack_from(buf, 0)[0]
+        _SEQ.pack_into(buf, 0, seq + 1)  # odd: write in progress
+        try:
+            for name, value in values.items():
+                if name in self.fields:
+                    field, offset, convert = self.fields[name]
+                    field.pack_into(buf, offset, convert(value))
+        finally:
+            _SEQ.pack_into(buf, 0, seq + 2)
+
+    def version(self):
+        """Current sequence number; changes on every write."""
+        return _SEQ.unpack_from(self.shm.buf, 0)[0]
+
+    def changed_since(self, version):
+        return self.version() != version
+
+    def read(self):
+        """Return a consistent `(version, values)` pair, retrying while a write is in progress."""
+        buf = self.shm.buf
+        while True:
+            before = _SEQ.unpack_from(buf, 0)[0]
+            if before & 1:
+                time.sleep(0)  # let the writer finish
+                continue
+            values = self.values_struct.unpack_from(buf, _SEQ.size)
+            if _SEQ.unpack_from(buf, 0)[0] == before:
+                return before, dict(zip(self.names, values))
+
+    def close(self):
+        """Detach this process from the shared block."""
+        self.shm.close()
+
+    def unlink(self):
+        """Detach and free the shared block. Call once, from the process that created it."""
+        self.close()
+        if self.owner:
+            self.shm.unlink()
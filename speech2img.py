@@ -1,4 +1,3 @@
-import requests
 import json
 import os
 import base64
@@ -7,88 +6,131 @@ import re
 import threading
 import queue
 import wave
+import itertools
+import numpy as np
 import pyaudio
 from pydub import AudioSegment
 import matplotlib.pyplot as plt
 from PIL import Image
 from io import BytesIO
+from stage_pipeline import ReorderBuffer, start_stage
+from stage_metrics import start_metrics
+from voice_activity import VoiceActivitySegmenter
+from api_client import metrics, transcribe_audio, transcribe_audio_stream, reprocess_text_with_ollama, txt2img
 
-# Configuration
-WHISPER_API_URL = "http://localhost:8080/inference"
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
-OLLAMA_MODEL = "llama3.2"
-STABLE_DIFFUSION_URL = "http://localhost:7860/sdapi/v1/txt2img"
+# Configuration (service URLs, timeouts and retries are in api_client.py)
 CHUNK_DURATION = 5  # seconds
+SAMPLE_RATE = 16000
+CHANNELS = 1
+SAMPLE_WIDTH = 2  # bytes, pyaudio.paInt16
+BLOCK_SIZE = 1024  # frames per read from the microphone
+BLOCKS_PER_CHUNK = int(SAMPLE_RATE / BLOCK_SIZE * CHUNK_DURATION)
+CHUNK_BYTES = BLOCKS_PER_CHUNK * BLOCK_SIZE * CHANNELS * SAMPLE_WIDTH
 
-# Queue for processing pipeline
-audio_queue = queue.Queue()
-processing_queue = queue.Queue()
+# Drop silence before any model call and cut chunks at pauses in speech rather
+# than every CHUNK_DURATION seconds (which then only caps a chunk's length)
+VAD_ENABLED = True
+
+# Start uploading each chunk to Whisper as soon as recording of it begins,
+# instead of waiting for the whole chunk. Needs fixed-length chunks, so only
+# applies with VAD_ENABLED = False.
+STREAMING_UPLOAD = False
+METRICS_PORT = None  # request timings on http://127.0.0.1:<port>/metrics (None = off; e.g. 9101)
+
+# Concurrent requests allowed per service. Each stage runs independently, so
+# the next chunk is transcribed while the previous one is still being drawn.
+TRANSCRIBE_WORKERS = 1
+OLLAMA_WORKERS = 1
+SD_WORKERS = 1
+STAGE_QUEUE_SIZE = 2  # chunks waiting between stages before earlier stages block
+
+# Queues for processing pipeline, items are (sequence number, payload)
+audio_queue = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+transcription_queue = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+response_queue = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
 image_display_queue = queue.Queue()
 
+# Images are displayed in the order their audio was recorded
+image_order = ReorderBuffer(lambda seq, image: image_display_queue.put(image))
+
 
 def record_audio():
-    """Records audio from the microphone in chunks and places it in the processing queue."""
+    """
+    Records audio from the microphone in chunks and places them in the processing queue.
+
+    Chunks stay in memory as raw PCM bytes. With VAD_ENABLED they are speech segments
+    cut at pauses; otherwise fixed CHUNK_DURATION windows. With STREAMING_UPLOAD, a
+    queue of blocks is sent instead at the start of each chunk and filled as the
+    blocks are read.
+    """
     p = pyaudio.PyAudio()
-    format = pyaudio.paInt16
-    channels = 1
-    rate = 16000
-    chunk_size = 1024
-    
-    stream = p.open(format=format, channels=channels, rate=rate, input=True, frames_per_buffer=chunk_size)
+    stream = p.open(format=pyaudio.paInt16, channels=CHANNELS, rate=SAMPLE_RATE, input=True,
+                    frames_per_buffer=BLOCK_SIZE)
     
     print("Recording started...")
-    while True:
-        frames = []
-        for _ in range(0, int(rate / chunk_size * CHUNK_DURATION)):
-            data = stream.read(chunk_size)
-            frames.append(data)
-        
-        filename = f"chunk_{uuid.uuid4().hex}.wav"
-        with wave.open(filename, "wb") as wf:
-            wf.setnchannels(channels)
-            wf.setsampwidth(p.get_sample_size(format))
-            wf.setframerate(rate)
-            wf.writeframes(b"".join(frames))
-        
-        audio_queue.put(filename)  # Send to processing queue
+    if VAD_ENABLED:
+        segmenter = VoiceActivitySegmenter(SAMPLE_RATE, max_segment=CHUNK_DURATION)
+        sequence = itertools.count()
+        while True:
+            block = np.frombuffer(stream.read(BLOCK_SIZE), dtype=np.int16)
+            for segment in segmenter.feed(block):
+                enqueue_audio(next(sequence), segment.tobytes())  # Send to processing queue
+    for seq in itertools.count():
+        if STREAMING_UPLOAD:
+            blocks = queue.Queue()
+            enqueue_audio(seq, blocks)  # Send to processing queue before recording it
+            for _ in range(BLOCKS_PER_CHUNK):
+                blocks.put(stream.read(BLOCK_SIZE))
+            blocks.put(None)
+        else:
+            frames = []
+            for _ in range(BLOCKS_PER_CHUNK):
+                frames.append(stream.read(BLOCK_SIZE))
+            enqueue_audio(seq, b"".join(frames))  # Send to processing queue
     
     stream.stop_stream()
     stream.close()
     p.terminate()
 
 
-def transcribe_audio(audio_path):
-    """Sends audio to Whisper for transcription."""
-    with open(audio_path, "rb") as f:
-        response = requests.post(
-            WHISPER_API_URL,
-            files={"file": f},
-            data={"temperature": "0.0", "temperature_inc": "0.2", "response_format": "json"},
-        )
-    
-    if response.status_code == 200:
-        response_json = response.json()
-        return response_json.get("text", "").strip()
-    else:
-        raise Exception(f"Whisper API error: {response.text}")
+def enqueue_audio(seq, audio):
+    """Queue a recorded chunk, dropping the oldest waiting one rather than stalling the recorder."""
+    while True:
+        try:
+            audio_queue.put_nowait((seq, audio))
+            return
+        except queue.Full:
+            try:
+                dropped_seq, _ = audio_queue.get_nowait()
+            except queue.Empty:
+                continue
+            print(f"Pipeline behind, dropping audio chunk {dropped_seq}")
+            image_order.skip(dropped_seq)
 
 
-def reprocess_text_with_ollama(text, guiding_prompt):
-    """Sends text to Ollama for reprocessing."""
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": f"{guiding_prompt}\n\n{text}",
-        "stream": False
-    }
-    response = requests.post(OLLAMA_API_URL, json=payload)
-    if response.status_code == 200:
-        return response.json().get("response", "").strip()
-    else:
-        raise Exception(f"Ollama API error: {response.text}")
+def pcm_to_wav(pcm):
+    """Wraps raw PCM bytes in an in-memory WAV file for upload."""
+    buffer = BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(CHANNELS)
+        wf.setsampwidth(SAMPLE_WIDTH)
+        wf.setframerate(SAMPLE_RATE)
+        wf.writeframes(pcm)
+    buffer.seek(0)
+    return buffer
+
+
+def recorded_blocks(blocks):
+    """Yields blocks from a chunk that is still being recorded, until its end marker."""
+    while True:
+        block = blocks.get(timeout=2 * CHUNK_DURATION)
+        if block is None:
+            return
+        yield block
 
 
 def generate_sd_image(prompt, output_folder="generated_images"):
-    """Sends a text prompt to Stable Diffusion, saves the generated image, and displays it."""
+    """Sends a text prompt to Stable Diffusion, saves the generated image, and returns it."""
     os.makedirs(output_folder, exist_ok=True)
     payload = {
         "prompt": prompt,
@@ -98,57 +140,92 @@ def generate_sd_image(prompt, output_folder="generated_images"):
         "height": 512,
         "sampler_index": "Euler a"
     }
-    response = requests.post(STABLE_DIFFUSION_URL, json=payload)
-    if response.status_code == 200:
-        result = response.json()
-        images = result.get("images", [])
-        if images:
-            img_data = images[0]
-            img_bytes = base64.b64decode(img_data)
-            image = Image.open(BytesIO(img_bytes))
-            filename = f"{uuid.uuid4().hex}.png"
-            img_path = os.path.join(output_folder, filename)
-            image.save(img_path)
-            print(f"Saved image: {img_path}")
-            print("enqueueing image for display")
-            image_display_queue.put(image)
-            
-    else:
-        raise Exception(f"Stable Diffusion API error: {response.text}")
+    images = txt2img(payload)
+    if images:
+        img_data = images[0]
+        img_bytes = base64.b64decode(img_data)
+        image = Image.open(BytesIO(img_bytes))
+        filename = f"{uuid.uuid4().hex}.png"
+        img_path = os.path.join(output_folder, filename)
+        image.save(img_path)
+        print(f"Saved image: {img_path}")
+        return image
 
         
-def process_audio():
-    """Processes recorded audio through transcription, text processing, and image generation."""
-    guiding_prompt = "Generate a poetic response suitable for image generation. Just give the text all on one line by itself, do not give explanation or any further questions."
-    image_prompt = "illustration inked outline translucent washes"
-    
-    while True:
-        audio_path = audio_queue.get()
+GUIDING_PROMPT = "Generate a poetic response suitable for image generation. Just give the text all on one line by itself, do not give explanation or any further questions."
+IMAGE_PROMPT = "illustration inked outline translucent washes"
+
+
+def pipeline_stage(func):
+    """Wrap a per-chunk step so that a failure drops only that chunk and keeps image order intact."""
+    def run(item):
+        seq, payload = item
         try:
-            transcription = transcribe_audio(audio_path)
-            print("Transcription:", transcription)
-            
-            response = reprocess_text_with_ollama(transcription, guiding_prompt)
-            #response = json.loads(reprocessed_text)
-            print(response)
-            generate_sd_image(f"{image_prompt} {response}")
-            # sd_prompts = response.get("sd-prompt", [])
-            
-            #for prompt in sd_prompts:
-            #    generate_sd_image(f"{image_prompt} {prompt}")
-        
+            result = func(payload)
         except Exception as e:
-            print(f"Error processing audio chunk: {e}")
-        finally:
-            os.remove(audio_path)
+            print(f"Error processing audio chunk {seq}: {e}")
+            result = None
+        if result is None:
+            image_order.skip(seq)
+            return None
+        return seq, result
+    return run
+
+
+def transcribe_chunk(audio):
+    if isinstance(audio, queue.Queue):
+        transcription = transcribe_audio_stream(recorded_blocks(audio), CHUNK_BYTES, SAMPLE_RATE,
+                                                CHANNELS, SAMPLE_WIDTH)
+    else:
+        transcription = transcribe_audio(pcm_to_wav(audio))
+    print("Transcription:", transcription)
+    return transcription
+
+
+def reprocess_chunk(transcription):
+    response = reprocess_text_with_ollama(transcription, GUIDING_PROMPT)
+    #response = json.loads(reprocessed_text)
+    print(response)
+    return response
+
+
+def generate_chunk(response):
+    # sd_prompts = response.get("sd-prompt", [])
+
+    #for prompt in sd_prompts:
+    #    generate_sd_image(f"{IMAGE_PROMPT} {prompt}")
+    return generate_sd_image(f"{IMAGE_PROMPT} {response}")
+
+
+transcribe_stage = pipeline_stage(transcribe_chunk)
+reprocess_stage = pipeline_stage(reprocess_chunk)
+generate_stage = pipeline_stage(generate_chunk)
+
+
+def generate_and_display(item):
+    result = generate_stage(item)
+    if result is not None:
+        print("enqueueing image for display")
+        image_order.push(*result)
+
+
+def process_audio(stop_event):
+    """Runs transcription, text processing and image generation as concurrent stages."""
+    start_stage(transcribe_stage, audio_queue, transcription_queue, stop_event,
+                workers=TRANSCRIBE_WORKERS, name="transcribe")
+    start_stage(reprocess_stage, transcription_queue, response_queue, stop_event,
+                workers=OLLAMA_WORKERS, name="ollama")
+    start_stage(generate_and_display, response_queue, None, stop_event,
+                workers=SD_WORKERS, name="generate")
 
 
 if __name__ == "__main__":
     recording_thread = threading.Thread(target=record_audio, daemon=True)
-    processing_thread = threading.Thread(target=process_audio, daemon=True)
-    
+    stop_event = threading.Event()
+
+    start_metrics(METRICS_PORT, metrics=metrics)
     recording_thread.start()
-    processing_thread.start()
+    process_audio(stop_event)
 
     plt.ion()  # Turn on interactive mode for non-blocking updates
     fig, ax = plt.subplots()  # Create figure and axis once
@@ -0,0 +1,167 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class StageMetrics:
+    """
+    Rolling per-stage latency percentiles and frame counters for the realtime loops.
+
+    Each stage keeps its last `window` durations, from which p50/p95/p99 are computed
+    on demand. Counters (dropped, skipped, ...) are plain running totals. Both can be
+    exported as JSON lines and as Prometheus text on a localhost HTTP endpoint, so a
+    slow stage can be spotted during a show without attaching a profiler.
+
+    Example Usage:
+    --------------
+    ```python
+    metrics = StageMetrics()
+    metrics.serve(9100)                     # http://127.0.0.1:9100/metrics
+    metrics.log_json_lines("metrics.jsonl")
+
+    with metrics.time("capture"):
+        ret, frame = cap.read()
+    metrics.count("dropped")
+    ```
+
+    GPU work is asynchronous, so by default a stage is charged for the time its call
+    takes on the host. Pass `sync=torch.cuda.synchronize` to `time()` to charge it for
+    the device work it queued as well.
+    """
+
+    def __init__(self, window=512):
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = {}  # stage -> deque of seconds
+        self.totals = {}  # stage -> number of samples ever recorded
+        self.counters = {}
+
+    def record(self, stage, seconds):
+        """Add one duration (in seconds) for a stage."""
+        with self.lock:
+            if stage not in self.samples:
+                self.samples[stage] = deque(maxlen=self.window)
+                self.totals[stage] = 0
+            self.samples[stage].append(seconds)
+            self.totals[stage] += 1
+
+    @contextmanager
+    def time(self, stage, sync=None):
+        """Time the body of a `with` block as one sample of `stage`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if sync is not None:
+                sync()
+            self.record(stage, time.perf_counter() - start)
+
+    def count(self, name, n=1):
+        """Increment a counter."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set_counter(self, name, value):
+        """Set a counter to a total tracked elsewhere (e.g. a buffer's drop count)."""
+        with self.lock:
+            self.counters[name] = value
+
+    def snapshot(self):
+        """Current percentiles (in milliseconds) and counters as a plain dict."""
+        with self.lock:
+            samples = {stage: sorted(values) for stage, values in self.samples.items()}
+            totals = dict(self.totals)
+            counters = dict(self.counters)
+        stages = {}
+        for stage, values in samples.items():
+            if not values:
+                continue
+            stats = {"count": totals[stage], "mean_ms": 1000 * sum(values) / len(values)}
+            for q in QUANTILES:
+                index = min(len(values) - 1, int(q * len(values)))
+                stats[f"p{int(q * 100)}_ms"] = 1000 * values[index]
+            stages[stage] = stats
+        return {"time": time.time(), "stages": stages, "counters": counters}
+
+    def json_line(self):
+        return json.dumps(self.snapshot())
+
+    def prometheus_text(self):
+        """Render the snapshot in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP alchemy_stage_seconds Rolling per-stage latency.",
+            "# TYPE alchemy_stage_seconds summary",
+        ]
+        for stage, stats in snapshot["stages"].items():
+            for q in QUANTILES:
+                seconds = stats[f"p{int(q * 100)}_ms"] / 1000
+                lines.append(f'alchemy_stage_seconds{{stage="{stage}",quantile="{q}"}} {seconds:.6f}')
+            lines.append(f'alchemy_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        lines.append("# HELP alchemy_frames_total Frame counters (dropped, skipped, ...).")
+        lines.append("# TYPE alchemy_frames_total counter")
+        for name, value in snapshot["counters"].items():
+            lines.append(f'alchemy_frames_total{{kind="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serve `/metrics` (Prometheus text) and `/json` from a background thread. If the
+        port is taken, warns and returns None; the show carries on without the endpoint.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/json"):
+                    body, content_type = metrics.json_line() + "\n", "application/json"
+                else:
+                    body, content_type = metrics.prometheus_text(), "text/plain; version=0.0.4"
+                body = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep the console free for the show
+
+        try:
+            server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            print(f"Metrics endpoint not started, {host}:{port} unavailable: {e}")
+            return None
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Serving metrics on http://{host}:{port}/metrics")
+        return server
+
+    def log_json_lines(self, path, interval=1.0):
+        """Append a snapshot to `path` every `interval` seconds from a background thread."""
+        def run():
+            with open(path, "a") as file:
+                while True:
+                    time.sleep(interval)
+                    file.write(self.json_line() + "\n")
+                    file.flush()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+def start_metrics(port=None, log_path=None, window=512, metrics=None):
+    """Create a StageMetrics (or take `metrics`) and start whichever exporters are configured."""
+    if metrics is None:
+        metrics = StageMetrics(window)
+    if port:
+        metrics.serve(port)
+    if log_path:
+        metrics.log_json_lines(log_path)
+    return metrics
@@ -0,0 +1,116 @@
+import queue
+import threading
+
+
+def put_latest(q, item):
+    """
+    Put without blocking, discarding the oldest queued item if the queue is full.
+    Returns the number of items discarded.
+    """
+    discarded = 0
+    while True:
+        try:
+            q.put_nowait(item)
+            return discarded
+        except queue.Full:
+            try:
+                q.get_nowait()
+                discarded += 1
+            except queue.Empty:
+                pass
+
+
+def put_until_stopped(q, item, stop_event, poll=0.1):
+    """Blocking put that gives up once `stop_event` is set. Returns True if the item was queued."""
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=poll)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def start_stage(func, inbox, outbox, stop_event, workers=1, drop_oldest=False, on_drop=None, name=None, poll=0.1):
+    """
+    Start `workers` daemon threads running one pipeline stage.
+
+    Each thread takes an item from `inbox`, calls `func(item)` and puts the result on
+    `outbox`. With `inbox=None` the stage is a source and `func()` is called with no
+    arguments; with `outbox=None` it is a sink. A result of None is not passed on.
+
+    Hand-offs are bounded by the queues' `maxsize`. With `drop_oldest=True` the stage
+    never blocks on a full `outbox` and replaces the oldest item instead, which is what
+    a camera source wants; otherwise it blocks, giving backpressure to earlier stages.
+    `on_drop(n)` is called whenever items are discarded this way.
+
+    Returns the list of started threads.
+    """
+    def run():
+        while not stop_event.is_set():
+            if inbox is None:
+                result = func()
+            else:
+                try:
+                    item = inbox.get(timeout=poll)
+                except queue.Empty:
+                    continue
+                result = func(item)
+            if result is None or outbox is None:
+                continue
+            if drop_oldest:
+                discarded = put_latest(outbox, result)
+                if discarded and on_drop is not None:
+                    on_drop(discarded)
+            else:
+                put_until_stopped(outbox, result, stop_event, poll)
+
+    threads = []
+    for i in range(workers):
+        thread = threading.Thread(target=run, name=f"{name or func.__name__}-{i}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+class ReorderBuffer:
+    """
+    Collects results that finish out of order and releases them in sequence order.
+
+    Every sequence number from `start` upwards must eventually be either `push`ed or
+    `skip`ped; a missing number holds back everything after it. `emit(seq, item)` is
+    called for each released item, under a lock, so output order is preserved even
+    when several worker threads push at once.
+    """
+
+    _SKIPPED = object()
+
+    def __init__(self, emit, start=0):
+        self.emit = emit
+        self.next_seq = start
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def push(self, seq, item):
+        """Hand in the result for `seq`."""
+        with self.lock:
+            self.pending[seq] = item
+            self._release()
+
+    def skip(self, seq):
+        """Mark `seq` as producing no result (failed or dropped) so later items are not held back."""
+        with self.lock:
+            self.pending[seq] = self._SKIPPED
+            self._release()
+
+    def _release(self):
+        while self.next_seq in self.pending:
+            item = self.pending.pop(self.next_seq)
+            if item is not self._SKIPPED:
+                self.emit(self.next_seq, item)
+            self.next_seq += 1
+
+    def waiting(self):
+        """Number of results held back waiting for an earlier one."""
+        with self.lock:
+            return len(self.pending)
@@ -23,15 +23,30 @@ import torch
 from utils.wrapper import StreamDiffusionWrapper
 import cv2
 from PySpout import SpoutSender
-import PIL.Image
 from OpenGL.GL import GL_RGB
-
-# import PIL.Image
-# from streamdiffusion.image_utils import pil2tensor, postprocess_image
+from stage_metrics import start_metrics
+from frame_convert import FrameConverter
+from realtime_loops import StreamLoop
 
 width = 512
 height = 512
 
+# Run capture, preprocessing, inference and output as overlapping threads.
+# Set to False for the original one-frame-at-a-time loop.
+PIPELINED = True
+PIPELINE_DEPTH = 1  # frames held between stages (1-2)
+
+# Send in-between frames at this rate when the model is slower (0 = off).
+# "blend" cross-fades, "flow" warps along optical flow. Runs the pipelined loop.
+INTERPOLATE_FPS = 0
+INTERPOLATE_MODE = "blend"
+
+# Per-stage timings on http://127.0.0.1:<port>/metrics (None = off; e.g. 9100, but
+# that is also node_exporter's port), and optionally as JSON lines
+METRICS_PORT = None
+METRICS_LOG = None
+metrics = start_metrics(METRICS_PORT, METRICS_LOG)
+
 cap = cv2.VideoCapture(0)
 cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
 cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
@@ -63,36 +78,15 @@ sdw.prepare(
     delta=0.5,
 )
 
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        time.sleep(0.01)  # Prevent CPU overuse
-        continue
-
-    # OLD METHOD - uses pillow, pil2tensor, torch.cat, postprocess_image
-    # img = PIL.Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-    # input_frame = pil2tensor(img)
-    # input_batch = torch.cat([input_frame])
-    # output_images = sdw.stream(input_batch.to(device="cuda", dtype=torch.float16)).cpu()
-    # output_image = postprocess_image(output_images, output_type="pil")[0]
-    # sender.send_image(output_image, False)
-    
-    # NEW METHOD
-    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-    # Convert to PyTorch tensor and normalize to [0,1]
-    tensor = torch.from_numpy(frame).permute(2, 0, 1).float() / 255  
-
-    # Add batch dimension (1, C, H, W) and move to GPU as float16
-    input_batch = tensor.unsqueeze(0).to(device="cuda", dtype=torch.float16)    
-
-    # Stream through model (stays on GPU)
-    output_images = sdw.stream(input_batch)
-    
-    # Convert output tensor to PIL Image
-    output_tensor = output_images[0].clamp(0, 1)
-    output_tensor = (output_tensor * 255).byte().cpu()  # Convert to uint8 on CPU
-    output_array = output_tensor.permute(1, 2, 0).numpy()  # Convert CHW → HWC
-    output_image = PIL.Image.fromarray(output_array)
-    
-    sender.send_image(output_image, False)
\ No newline at end of file
+# Reused staging buffers; enough output slots to cover every frame in flight
+converter = FrameConverter(height, width, device="cuda", dtype=torch.float16, slots=PIPELINE_DEPTH + 2)
+
+# The per-frame path lives in realtime_loops.py, where realtime-benchmark.py runs it too.
+# Before it: PIL.Image.fromarray(cvtColor(frame)) -> pil2tensor -> torch.cat -> .cuda(),
+# and sdw.stream(...).cpu() -> postprocess_image(output_type="pil") -> send_image.
+loop = StreamLoop(cap, sdw, converter, sender, metrics, width, height)
+
+if PIPELINED or INTERPOLATE_FPS:
+    loop.run_pipelined(PIPELINE_DEPTH, INTERPOLATE_FPS, INTERPOLATE_MODE)
+else:
+    loop.run_serial()
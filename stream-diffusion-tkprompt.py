@@ -21,10 +21,53 @@ import PIL.Image
 import threading
 import queue
 import tkinter as tk
+from stage_metrics import start_metrics
+from prompt_cache import PromptEmbeddingCache, PromptBank
 
 WIDTH = 512
 HEIGHT = 512
 
+# Per-stage timings on http://127.0.0.1:<port>/metrics (None = off; e.g. 9100, but
+# that is also node_exporter's port), and optionally as JSON lines
+METRICS_PORT = None
+METRICS_LOG = None
+metrics = start_metrics(METRICS_PORT, METRICS_LOG)
+
+# Crossfade between these prompts with the MIDI controls mapped (in
+# midi_mappings.json, see midi_learn.py) to the matching BANK_VARIABLES.
+# Leave empty to use only the typed prompt. A typed prompt holds until a
+# control is moved.
+BANK_PROMPTS = []
+BANK_VARIABLES = ["fader_0", "fader_1", "knob_0"]
+
+def start_prompt_bank(prompts):
+    """Register the bank's weight variables and start routing MIDI to them."""
+    if len(BANK_PROMPTS) > len(BANK_VARIABLES):
+        raise ValueError(
+            f"{len(BANK_PROMPTS)} BANK_PROMPTS but only {len(BANK_VARIABLES)} BANK_VARIABLES to weight them; "
+            "add a variable for each prompt"
+        )
+    # Imported here so the script runs without mido when the bank is off
+    from variable_handler import VariableHandler
+    import midi_learn
+
+    handler = VariableHandler()
+    weights = []
+    for name in BANK_VARIABLES[:len(BANK_PROMPTS)]:
+        weight = [0]
+        handler.register(name, weight)
+        weights.append(weight)
+    bank = PromptBank(prompts, BANK_PROMPTS, weights)
+
+    midi_learn.load_mappings()
+    if midi_learn.PORT_NAME in midi_learn.mido.get_input_names():
+        midi_learn.open_midi_input(midi_learn.PORT_NAME)
+        stop_flag = threading.Event()
+        threading.Thread(target=midi_learn.dispatch_midi, args=(handler, stop_flag), daemon=True).start()
+    else:
+        print(f"MIDI port '{midi_learn.PORT_NAME}' not found, prompt bank weights will stay at 0")
+    return bank
+
 def create_stream():
     acceleration = ["none", "xformers", "sfast", "tensorrt"][0],
     mode = ["img2img", "txt2img"][0]
@@ -65,9 +108,11 @@ def create_stream():
     return stream
 
 async def update_data(queue, frame):
-    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    tensor = torch.from_numpy(frame).permute(2, 0, 1).float() / 255  
-    input_batch = tensor.unsqueeze(0).to(device="cuda", dtype=torch.float16)
+    with metrics.time("preprocess"):
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        tensor = torch.from_numpy(frame).permute(2, 0, 1).float() / 255
+    with metrics.time("h2d"):
+        input_batch = tensor.unsqueeze(0).to(device="cuda", dtype=torch.float16)
     await queue.put(input_batch)
 
 async def get_latest_data(queue):
@@ -102,6 +147,10 @@ async def main():
     prompt_queue = queue.Queue()
     t = threading.Thread(target=prompt_window, args=(prompt_queue,))    
     current_prompt = "Skeleton in desolate Landscape"
+    # Encodes each prompt once; recent prompts are re-applied from cache
+    prompts = PromptEmbeddingCache(stream)
+    prompts.apply(current_prompt)
+    bank = start_prompt_bank(prompts) if BANK_PROMPTS else None
 
     cap = cv2.VideoCapture(0)
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, WIDTH)
@@ -115,7 +164,8 @@ async def main():
 
     t.start()
     while True:
-        ret, frame = cap.read()
+        with metrics.time("capture"):
+            ret, frame = cap.read()
 
         if not ret:
             await asyncio.sleep(0.01)  # prevent CPU overuse
@@ -127,14 +177,22 @@ async def main():
             if text == "end":
                 break
             current_prompt = text
+            with metrics.time("encode_prompt"):
+                prompts.apply(current_prompt)
         except queue.Empty:
             pass
 
+        if bank is not None:
+            bank.blend()
+
         await update_data(frame_queue, frame)
         frame_data = await get_latest_data(frame_queue)
         if frame_data is not None:
-            image = stream(frame_data, current_prompt)
-            spout.send_image(image, False)
+            # the wrapper returns a PIL image, so this includes d2h and postprocessing
+            with metrics.time("stream"):
+                image = stream(frame_data)
+            with metrics.time("send"):
+                spout.send_image(image, False)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
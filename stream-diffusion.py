@@ -5,10 +5,8 @@ import time
 import threading
 from multiprocessing import Process, Queue, get_context
 from multiprocessing.connection import Connection
-from typing import List, Literal, Dict, Optional
+from typing import List, Literal, Dict, Optional, Tuple
 import torch
-import PIL.Image
-from streamdiffusion.image_utils import pil2tensor
 import cv2
 import fire
 
@@ -16,28 +14,40 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
 
 from utils.viewer import receive_images
 from utils.wrapper import StreamDiffusionWrapper
+from frame_ring_buffer import FrameRingBuffer
+from frame_transport import SharedFrameTransport
+from stage_metrics import start_metrics
+from frame_convert import FrameConverter
+from frame_interpolator import FrameInterpolator
+from quality_governor import QualityGovernor, change_kind, REBUILD, PREPARE
+from realtime_loops import RingBufferLoop, capture_frames
 
-inputs = []
+# Number of raw camera frames held between inference steps
+RING_BUFFER_CAPACITY = 16
 
-def webcam_capture(event, height, width):
-    global inputs
-    cap = cv2.VideoCapture(0)
+# Settings the quality governor steps through when --target_fps is set, best first.
+# Each entry overrides the command-line settings. Only fewer denoising steps or a
+# smaller resolution make a frame cheaper, and both need a new model: it is built
+# in the background while the current one keeps running, which takes seconds to
+# minutes and holds both in VRAM until the swap. (Filter threshold steps are
+# applied in place but don't help: a skipped frame still takes an inference time.)
+QUALITY_LADDER = [
+    {},
+    {"t_index_list": [35]},
+    {"t_index_list": [35], "width": 384, "height": 384},
+]
+
+def webcam_capture(event, height, width, frame_buffer, metrics, camera=0):
+    cap = cv2.VideoCapture(camera)
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
-    while True:
-        if event.is_set():
-            break
-        ret, frame = cap.read()
-        if not ret:
-            continue
-        img = PIL.Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        inputs.append(pil2tensor(img))
-    cap.release()
+    capture_frames(event, cap, height, width, frame_buffer, metrics, f"capture{camera}" if camera else "capture")
 
 def image_generation_process(
-    queue: Queue,
-    fps_queue: Queue,
+    queues: List[SharedFrameTransport],
+    fps_queues: List[Queue],
     close_queue: Queue,
+    cameras: List[int],
     model_id_or_path: str,
     lora_dict: Optional[Dict[str, float]],
     prompt: str,
@@ -55,66 +65,140 @@ def image_generation_process(
     enable_similar_image_filter: bool,
     similar_image_filter_threshold: float,
     similar_image_filter_max_skip_frame: float,
+    metrics_port: Optional[int],
+    metrics_log: Optional[str],
+    interpolate_fps: int,
+    interpolate_mode: Literal["blend", "flow"],
+    target_fps: float,
 ):
-    global inputs
-    stream = StreamDiffusionWrapper(
-        model_id_or_path=model_id_or_path,
-        lora_dict=lora_dict,
-        t_index_list=[32, 45],
-        frame_buffer_size=frame_buffer_size,
-        width=width,
-        height=height,
-        warmup=10,
-        acceleration=acceleration,
-        do_add_noise=do_add_noise,
-        enable_similar_image_filter=enable_similar_image_filter,
-        similar_image_filter_threshold=similar_image_filter_threshold,
-        similar_image_filter_max_skip_frame=similar_image_filter_max_skip_frame,
-        mode="img2img",
-        use_denoising_batch=use_denoising_batch,
-        cfg_type=cfg_type,
-        seed=seed,
-    )
-    stream.prepare(
-        prompt=prompt,
-        negative_prompt=negative_prompt,
-        num_inference_steps=50,
-        guidance_scale=guidance_scale,
-        delta=delta,
-    )
+    metrics = start_metrics(metrics_port, metrics_log)
+    # Charge the GPU stages for their device time, not just the launch
+    sync = torch.cuda.synchronize if torch.cuda.is_available() else None
+
+    def prepare(stream):
+        stream.prepare(
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            num_inference_steps=50,
+            guidance_scale=guidance_scale,
+            delta=delta,
+        )
+
+    def build_stream(settings):
+        stream = StreamDiffusionWrapper(
+            model_id_or_path=model_id_or_path,
+            lora_dict=lora_dict,
+            t_index_list=settings["t_index_list"],
+            frame_buffer_size=frame_buffer_size,
+            width=settings["width"],
+            height=settings["height"],
+            warmup=10,
+            acceleration=acceleration,
+            do_add_noise=do_add_noise,
+            enable_similar_image_filter=enable_similar_image_filter,
+            similar_image_filter_threshold=settings["similar_image_filter_threshold"],
+            similar_image_filter_max_skip_frame=similar_image_filter_max_skip_frame,
+            mode="img2img",
+            use_denoising_batch=use_denoising_batch,
+            cfg_type=cfg_type,
+            seed=seed,
+        )
+        prepare(stream)
+        return stream
+
+    settings = {
+        "width": width,
+        "height": height,
+        "t_index_list": [32, 45],
+        "similar_image_filter_threshold": similar_image_filter_threshold,
+    }
+    governor = QualityGovernor(settings, QUALITY_LADDER, target_fps) if target_fps else None
+    stream = build_stream(settings)
+    rebuilt = {}  # "stream": a model built in the background, waiting to be swapped in
+    rebuild_thread = None
+    # With several cameras, frame_buffer_size is the number of cameras: one batch lane each
+    multi_source = len(cameras) > 1
+    frame_buffers = [
+        FrameRingBuffer(max(RING_BUFFER_CAPACITY, 1 if multi_source else frame_buffer_size), height, width)
+        for _ in cameras
+    ]
+    converter = FrameConverter(height, width, device=stream.device, dtype=stream.dtype, batch=frame_buffer_size)
     event = threading.Event()
-    capture_thread = threading.Thread(target=webcam_capture, args=(event, height, width))
-    capture_thread.start()
+    capture_threads = [
+        threading.Thread(target=webcam_capture, args=(event, height, width, frame_buffer, metrics, camera))
+        for camera, frame_buffer in zip(cameras, frame_buffers)
+    ]
+    for capture_thread in capture_threads:
+        capture_thread.start()
+    interpolators = [None] * len(queues)
+    if interpolate_fps:
+        # Fill the gaps between model outputs so each viewer runs at interpolate_fps
+        interpolators = [
+            FrameInterpolator(lambda frame, queue=queue: queue.put(frame.transpose(2, 0, 1), block=False),
+                              interpolate_fps, interpolate_mode)
+            for queue in queues
+        ]
+        for interpolator in interpolators:
+            interpolator.start()
+    # The per-frame path, shared with realtime-benchmark.py
+    loop = RingBufferLoop(frame_buffers, converter, queues, metrics, width, height, frame_buffer_size,
+                          interpolators, sync)
     time.sleep(5)
     while True:
         try:
             if not close_queue.empty():
                 break
-            if len(inputs) < frame_buffer_size:
-                time.sleep(0.005)
+            if "stream" in rebuilt:
+                settings, stream = rebuilt.pop("stream")
+                loop.previous_output = None
+                torch.cuda.empty_cache()
+                print(f"quality level {governor.level} active")
+            result = loop.step(stream, settings)
+            if result is None:
                 continue
-            start_time = time.time()
-            sampled_inputs = []
-            for i in range(frame_buffer_size):
-                index = (len(inputs) // frame_buffer_size) * i
-                sampled_inputs.append(inputs[len(inputs) - index - 1])
-            input_batch = torch.cat(sampled_inputs)
-            inputs.clear()
-            output_images = stream.stream(
-                input_batch.to(device=stream.device, dtype=stream.dtype)
-            ).cpu()
-            if frame_buffer_size == 1:
-                output_images = [output_images]
-            for output_image in output_images:
-                queue.put(output_image, block=False)
-            fps = 1 / (time.time() - start_time)
-            fps_queue.put(fps)
+            frame_time, rendered = result
+            fps = 1 / frame_time
+            for fps_queue in fps_queues:
+                fps_queue.put(fps)
+            building = rebuild_thread is not None and (rebuild_thread.is_alive() or "stream" in rebuilt)
+            # Judge only frames the model rendered: the filter sleeps out a skipped frame
+            # and returns the last image, so its time says nothing about the settings
+            if governor is not None and rendered and not building and governor.record(frame_time):
+                new_settings = governor.settings
+                kind = change_kind(settings, new_settings)
+                print(f"quality level {governor.level} ({kind}): {new_settings}")
+                if kind == REBUILD:
+                    # Keep rendering with the current model; it is swapped at the top of the loop
+                    def rebuild(new_settings=new_settings):
+                        try:
+                            rebuilt["stream"] = (new_settings, build_stream(new_settings))
+                        except Exception as e:
+                            print(f"quality level {new_settings} could not be built, keeping the current model: {e}")
+                    rebuild_thread = threading.Thread(target=rebuild, daemon=True)
+                    rebuild_thread.start()
+                else:
+                    if kind == PREPARE:
+                        stream.stream.t_list = new_settings["t_index_list"]
+                        prepare(stream)
+                    if enable_similar_image_filter:
+                        stream.stream.similar_filter.set_threshold(new_settings["similar_image_filter_threshold"])
+                    settings = new_settings
+                    loop.previous_output = None
+                metrics.set_counter("quality_level", governor.level)
         except KeyboardInterrupt:
             break
     print("closing image_generation_process...")
     event.set()
-    capture_thread.join()
+    for capture_thread in capture_threads:
+        capture_thread.join()
+    for interpolator in interpolators:
+        if interpolator is not None:
+            interpolator.stop()
     print(f"fps: {fps}")
+    for camera, frame_buffer, queue in zip(cameras, frame_buffers, queues):
+        print(f"camera {camera} frames: {frame_buffer.written}, dropped: {frame_buffer.dropped}")
+        print(f"camera {camera} output frames: {queue.stats()}")
+        queue.close()
 
 def main(
     model_id_or_path: str = "KBlueLeaf/kohaku-v2.1",
@@ -134,17 +218,33 @@ def main(
     enable_similar_image_filter: bool = True,
     similar_image_filter_threshold: float = 0.99,
     similar_image_filter_max_skip_frame: float = 10,
+    output_slots: int = 4,
+    drop_policy: Literal["drop-oldest", "latest-only"] = "drop-oldest",
+    metrics_port: Optional[int] = None,
+    metrics_log: Optional[str] = None,
+    interpolate_fps: int = 0,
+    interpolate_mode: Literal["blend", "flow"] = "blend",
+    target_fps: float = 0,
+    cameras: Tuple[int, ...] = (0,),
 ):
+    # Several cameras (--cameras=0,1) share one model: one batch entry and one viewer each
+    cameras = [cameras] if isinstance(cameras, int) else list(cameras)
+    if len(cameras) > 1:
+        frame_buffer_size = len(cameras)
     ctx = get_context('spawn')
-    queue = ctx.Queue()
-    fps_queue = ctx.Queue()
+    queues = [
+        SharedFrameTransport(ctx, (1, 3, height, width), slots=output_slots, policy=drop_policy)
+        for _ in cameras
+    ]
+    fps_queues = [ctx.Queue() for _ in cameras]
     close_queue = Queue()
     process1 = ctx.Process(
         target=image_generation_process,
         args=(
-            queue,
-            fps_queue,
+            queues,
+            fps_queues,
             close_queue,
+            cameras,
             model_id_or_path,
             lora_dict,
             prompt,
@@ -162,12 +262,22 @@ def main(
             enable_similar_image_filter,
             similar_image_filter_threshold,
             similar_image_filter_max_skip_frame,
+            metrics_port,
+            metrics_log,
+            interpolate_fps,
+            interpolate_mode,
+            target_fps,
         ),
     )
     process1.start()
-    process2 = ctx.Process(target=receive_images, args=(queue, fps_queue))
-    process2.start()
-    process2.join()
+    viewers = [
+        ctx.Process(target=receive_images, args=(queue, fps_queue))
+        for queue, fps_queue in zip(queues, fps_queues)
+    ]
+    for process2 in viewers:
+        process2.start()
+    for process2 in viewers:
+        process2.join()
     print("process2 terminated.")
     close_queue.put(True)
     print("process1 terminating...")
@@ -177,6 +287,8 @@ def main(
         process1.terminate()
     process1.join()
     print("process1 terminated.")
+    for queue in queues:
+        queue.unlink()
 
 if __name__ == "__main__":
     fire.Fire(main)
\ No newline at end of file
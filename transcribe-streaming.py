@@ -1,11 +1,9 @@
 import sounddevice as sd
 import numpy as np
-import queue
 import whisper
-import soundfile as sf
-import tempfile
-import os
 import warnings
+from voice_activity import VoiceActivitySegmenter
+from audio_ring_buffer import AudioRingBuffer
 
 warnings.filterwarnings("ignore", message="FP16 is not supported on CPU")
 
@@ -16,37 +14,46 @@ model = whisper.load_model("base", device="cpu")
 SAMPLE_RATE = 16000  # Match Whisper's preferred input rate
 BUFFER_DURATION = 2  # Buffer at least 2 seconds before transcription
 
-# Queue for audio buffering
-audio_queue = queue.Queue()
-chunk_buffer = []  # Buffer to accumulate audio
+# Skip silence and cut segments at pauses in speech instead of every
+# BUFFER_DURATION seconds
+VAD_ENABLED = True
+MAX_SEGMENT_DURATION = 10  # seconds, longest segment sent without a pause
+
+READ_DURATION = 0.1  # seconds of audio taken from the ring per VAD step
+RING_DURATION = 30  # seconds of audio the ring holds before the oldest is lost
+
+# Preallocated ring filled by the audio callback
+ring = AudioRingBuffer(RING_DURATION * SAMPLE_RATE)
 
 def audio_callback(indata, frames, time, status):
-    """Accumulate multiple chunks before transcription."""
-    global chunk_buffer
+    """Copy each block into the ring; no allocation on the audio thread."""
     if status:
         print(status)
-    chunk_buffer.append(indata.copy())
-    
-    # Ensure we have enough audio before processing
-    if len(chunk_buffer) >= int(BUFFER_DURATION * SAMPLE_RATE / frames):
-        full_chunk = np.concatenate(chunk_buffer, axis=0)
-        chunk_buffer = []
-        audio_queue.put(full_chunk)  # Send a longer chunk for transcription
+    ring.write(indata[:, 0])
 
-def transcribe_audio():
-    """Continuously transcribe audio chunks from the queue."""
+def audio_segments():
+    """Yield chunks to transcribe: speech segments with VAD, else fixed BUFFER_DURATION windows."""
+    if not VAD_ENABLED:
+        window = np.empty(BUFFER_DURATION * SAMPLE_RATE, dtype=np.float32)
+        while True:
+            # Ensure we have enough audio before processing
+            if ring.wait_for(len(window), timeout=1.0):
+                ring.read(window)
+                yield window  # reused, so it must be consumed before the next one
+    segmenter = VoiceActivitySegmenter(SAMPLE_RATE, max_segment=MAX_SEGMENT_DURATION)
+    block = np.empty(int(READ_DURATION * SAMPLE_RATE), dtype=np.float32)
     while True:
-        audio_chunk = audio_queue.get()
-        if audio_chunk is None:
-            break  # Stop when None is received
-        
+        if ring.wait_for(len(block), timeout=1.0):
+            count = ring.read(block)
+            yield from segmenter.feed(block[:count])
+
+def transcribe_audio():
+    """Continuously transcribe audio taken from the ring, passing the samples straight to Whisper."""
+    for audio_chunk in audio_segments():
         if len(audio_chunk) == 0:
             continue
-        
-        with tempfile.NamedTemporaryFile(delete=True, suffix=".wav") as temp_audio:
-            sf.write(temp_audio.name, audio_chunk, SAMPLE_RATE)
-            result = model.transcribe(temp_audio.name, language="en")
-            print(result["text"])
+        result = model.transcribe(audio_chunk, language="en")
+        print(result["text"])
 
 # Set up input stream
 stream = sd.InputStream(
@@ -63,4 +70,5 @@ try:
 except KeyboardInterrupt:
     print("\nStopping audio stream...")
     stream.stop()
-    audio_queue.put(None)
+    if ring.overruns:
+        print(f"Transcription fell behind, {ring.overruns / SAMPLE_RATE:.1f}s of audio lost")
@@ -33,22 +33,62 @@ class VariableHandler:
     print(my_var[0])  # Output: 42
     handler.stop()
     ```
+
+    Coalescing Mode:
+    ----------------
+    With `VariableHandler(coalesce=True)`, updates are not queued one by one. Only the
+    latest value per identifier is kept until the handler thread next wakes, and then
+    all of them are applied in one batch under a single lock. A fast fader sweep that
+    sends hundreds of messages costs one update, and readers never see values from
+    partway through a backlog. In the default mode, queued messages are also applied
+    in batches, in order.
+
+    Snapshots:
+    ----------
+    Every applied batch publishes a new immutable `(version, values)` pair, where
+    `values` maps each identifier to its current value. A render loop can read all
+    parameters at once, consistently and without taking the lock:
+
+    ```python
+    version, values = handler.snapshot()
+    ...
+    if handler.changed_since(version):
+        version, values = handler.snapshot()
+    ```
+    
+    Shared Memory:
+    --------------
+    Pass `shared_store=SharedParameterStore(...)` (see `shared_parameters.py`) to also
+    publish numeric variables into shared memory. Worker processes, such as a spawned
+    image generation process, can then read the latest values directly with
+    `store.read()`, without messages or pickling.
     
     Methods:
     --------
     - `register(identifier: str, variable_ref: list)`: Registers a variable reference.
     - `update_variable(identifier: str, value)`: Sends an update request to the queue.
+    - `set_variable(identifier: str, value)`: Applies an update immediately, bypassing the queue.
+    - `snapshot()`: Returns the latest `(version, values)` pair.
+    - `changed_since(version: int)`: True if anything was updated after `version`.
     - `stop()`: Stops the handler thread safely.
 
     Thread Safety:
     --------------
     A threading lock (`self.lock`) ensures safe access to the registry across multiple threads.
+    Snapshots are replaced whole, never modified, so reading one needs no lock.
     """
     
-    def __init__(self):
+    def __init__(self, coalesce=False, shared_store=None):
         self.registry = {}  # Stores variable references
         self.queue = queue.Queue()
         self.lock = threading.Lock()
+        self.coalesce = coalesce
+        self.pending = {}  # Latest value per identifier, in coalescing mode
+        self.pending_lock = threading.Lock()
+        self.pending_ready = threading.Event()
+        self.version = 0
+        self._snapshot = (0, {})
+        self.shared_store = shared_store
         self.running = True
         self.handler_thread = threading.Thread(target=self._handler_loop, daemon=True)
         self.handler_thread.start()
@@ -57,21 +97,73 @@ class VariableHandler:
         """Register a variable with an identifier."""
         with self.lock:
             self.registry[identifier] = variable_ref
+            self._publish()
 
     def update_variable(self, identifier, value):
         """Send an update request to the queue."""
-        self.queue.put((identifier, value))
+        if self.coalesce:
+            with self.pending_lock:
+                self.pending[identifier] = value
+            self.pending_ready.set()
+        else:
+            self.queue.put((identifier, value))
+
+    def set_variable(self, identifier, value):
+        """Apply an update immediately on the calling thread, e.g. from a MIDI callback."""
+        with self.lock:
+            if identifier in self.registry:
+                self.registry[identifier][0] = value
+                self._publish()
+
+    def snapshot(self):
+        """Return the latest `(version, values)` pair. Lock-free; the dict must not be modified."""
+        return self._snapshot
+
+    def changed_since(self, version):
+        """True if any variable was updated after the snapshot with this version."""
+        return self._snapshot[0] != version
+
+    def _next_batch(self):
+        """Wait up to a second for updates and return them as (identifier, value) pairs."""
+        if self.coalesce:
+            if not self.pending_ready.wait(timeout=1):
+                return []
+            with self.pending_lock:
+                self.pending_ready.clear()
+                batch, self.pending = self.pending, {}
+            return batch.items()
+        try:
+            batch = [self.queue.get(timeout=1)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _publish(self):
+        """Publish a new snapshot. Must be called with `self.lock` held."""
+        self.version += 1
+        values = {identifier: ref[0] for identifier, ref in self.registry.items()}
+        self._snapshot = (self.version, values)
+        if self.shared_store is not None:
+            self.shared_store.write(values)
 
     def _handler_loop(self):
         """Handler thread that processes the queue."""
         while self.running:
-            try:
-                identifier, value = self.queue.get(timeout=1)
-                with self.lock:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            with self.lock:
+                changed = False
+                for identifier, value in batch:
                     if identifier in self.registry:
                         self.registry[identifier][0] = value  # Update reference
-            except queue.Empty:
-                continue
+                        changed = True
+                if changed:
+                    self._publish()
 
     def stop(self):
         """Stop the handler thread."""
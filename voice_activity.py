@@ -0,0 +1,119 @@
+from collections import deque
+import numpy as np
+
+
+class VoiceActivitySegmenter:
+    """
+    Energy-based voice activity detection that turns a continuous stream of audio
+    into speech segments, cut at pauses instead of at fixed times.
+
+    Audio is analysed in short frames. A frame counts as speech when its level is
+    above both `threshold_db` (dBFS) and an adaptive noise floor plus `margin_db`, so
+    a noisy room does not read as constant speech. A segment starts at the first
+    speech frame (with `pre_roll` seconds of lead-in so onsets aren't clipped) and
+    ends after `pause` seconds of non-speech or once it reaches `max_segment` seconds.
+    Segments with less than `min_speech` seconds of speech are discarded, so silence
+    and short clicks never reach a model.
+
+    Example Usage:
+    --------------
+    ```python
+    segmenter = VoiceActivitySegmenter(sample_rate=16000)
+
+    for block in blocks:  # mono float32 or int16 ndarrays of any length
+        for segment in segmenter.feed(block):
+            transcribe(segment)
+    ```
+
+    Segments are returned in the dtype they were fed in. Audio is copied on the way
+    in, so callers may reuse the array they pass to `feed()`.
+    """
+
+    def __init__(self, sample_rate, frame_duration=0.03, threshold_db=-45.0, margin_db=10.0,
+                 pause=0.6, min_speech=0.3, max_segment=10.0, pre_roll=0.2):
+        self.frame_size = int(sample_rate * frame_duration)
+        self.threshold_db = threshold_db
+        self.margin_db = margin_db
+        self.pause_frames = max(1, int(pause / frame_duration))
+        self.min_speech_frames = max(1, int(min_speech / frame_duration))
+        self.max_frames = max(1, int(max_segment / frame_duration))
+        self.pre_roll = deque(maxlen=int(pre_roll / frame_duration))
+        self.noise_floor_db = threshold_db - margin_db
+        self.leftover = None
+        self.segment = None  # frames of the segment in progress, or None when idle
+        self.speech_frames = 0
+        self.silent_run = 0
+        # Stats
+        self.segments = 0
+        self.discarded = 0  # segments dropped for too little speech
+        self.silent_frames = 0  # frames dropped outside any segment
+
+    def level_db(self, frame):
+        """RMS level of a frame in dBFS."""
+        samples = frame.astype(np.float32)
+        if np.issubdtype(frame.dtype, np.integer):
+            samples /= -np.iinfo(frame.dtype).min
+        rms = np.sqrt(np.mean(samples * samples))
+        return 20 * np.log10(rms + 1e-10)
+
+    def is_speech(self, frame):
+        level = self.level_db(frame)
+        speech = level > max(self.threshold_db, self.noise_floor_db + self.margin_db)
+        if not speech:
+            # Track the noise floor: follow drops quickly, rises slowly
+            rate = 0.5 if level < self.noise_floor_db else 0.02
+            self.noise_floor_db += rate * (level - self.noise_floor_db)
+        return speech
+
+    def feed(self, samples):
+        """Add audio and return the list of segments it completed (often empty)."""
+        if self.leftover is not None:
+            samples = np.concatenate((self.leftover, samples))
+        else:
+            samples = samples.copy()  # frames are kept, so they must not alias the caller's buffer
+        usable = len(samples) - len(samples) % self.frame_size
+        self.leftover = samples[usable:].copy() if usable < len(samples) else None
+        finished = []
+        for start in range(0, usable, self.frame_size):
+            segment = self._add_frame(samples[start:start + self.frame_size])
+            if segment is not None:
+                finished.append(segment)
+        return finished
+
+    def flush(self):
+        """End the segment in progress, if any, and return it (or None)."""
+        return self._end_segment()
+
+    def _add_frame(self, frame):
+        speech = self.is_speech(frame)
+        if self.segment is None:
+            if not speech:
+                if len(self.pre_roll) == self.pre_roll.maxlen:
+                    self.silent_frames += 1
+                self.pre_roll.append(frame)
+                return None
+            self.segment = list(self.pre_roll)
+            self.pre_roll.clear()
+            self.speech_frames = 0
+            self.silent_run = 0
+
+        self.segment.append(frame)
+        if speech:
+            self.speech_frames += 1
+            self.silent_run = 0
+        else:
+            self.silent_run += 1
+        if self.silent_run >= self.pause_frames or len(self.segment) >= self.max_frames:
+            return self._end_segment()
+        return None
+
+    def _end_segment(self):
+        if self.segment is None:
+            return None
+        frames, speech_frames = self.segment, self.speech_frames
+        self.segment = None
+        if speech_frames < self.min_speech_frames:
+            self.discarded += 1
+            return None
+        self.segments += 1
+        return np.concatenate(frames)
@@ -15,40 +15,28 @@
 
 import cv2
 from diffusers import AutoPipelineForImage2Image
-from diffusers.utils import load_image
 import torch
-from PIL import Image
 from PySpout import SpoutSender
 from OpenGL.GL import * 
-import numpy as np
+from stage_metrics import start_metrics
+from frame_convert import FrameConverter
+from realtime_loops import run_sdturbo
+
+width = 640
+height = 480
+
+# Per-stage timings on http://127.0.0.1:<port>/metrics (None = off)
+METRICS_PORT = None
+metrics = start_metrics(METRICS_PORT)
 
 pipe = AutoPipelineForImage2Image.from_pretrained("stabilityai/sdxl-turbo", torch_dtype=torch.float16, variant="fp16")
 pipe.to("cuda")
 
-sender = SpoutSender("MyName", 640, 480, GL_RGB)
+sender = SpoutSender("MyName", width, height, GL_RGB)
 
 cap = cv2.VideoCapture(0)
 
-def convert_cv2_to_pillow(image):
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    image = Image.fromarray(image)
-    return image
-
-def convert_pillow_to_cv2(image):
-    image = np.array(image)
-    image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-    return image
-
-def generate_image(image):
-    image = load_image(image)
-    image = pipe("frog people", image=image, num_inference_steps=2, strength=0.5, guidance_scale=0.0).images[0]
-    return image
-
-while True:
-    ret, frame = cap.read()
-
-    image = convert_cv2_to_pillow(frame)
-    image = generate_image(image)
-    image = convert_pillow_to_cv2(image)
-    
-    sender.send_image(image, False)
\ No newline at end of file
+converter = FrameConverter(height, width, device="cuda", dtype=torch.float16)
+
+# Tensors in and out of the pipeline; see run_sdturbo in realtime_loops.py
+run_sdturbo(cap, pipe, converter, sender, metrics, width, height, "frog people")